@@ -1,3 +1,6 @@
-from .utmremoteclient import UTMRemoteClient
+from .utmremoteclient import ClientIdentity, UTMRemoteClient
+from .reconnect import ReconnectingUTMRemoteClient
+from .pool import UTMRemotePool
+from .syncclient import SyncUTMRemoteClient
 from .utmremotemessage import (
     UTMVirtualMachineStopMethod, UTMVirtualMachineStartOptions)
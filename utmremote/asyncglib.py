@@ -1,19 +1,14 @@
 import asyncio
 import gi
-import threading
 from gi.repository import GLib
 
+from .eventloop import EventLoopThread
 
-class AsyncLoop:
 
-    def __init__(self):
-        self._loop = asyncio.new_event_loop()
-        self._thread = threading.Thread(
-            target=self._loop.run_forever, daemon=True)
-        self._thread.start()
+class AsyncLoop(EventLoopThread):
 
     def submit(self, coro, when_done=None, when_exception=None):
-        fut = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        fut = self.run_coroutine(coro)
 
         def call_when_done():
             try:
@@ -0,0 +1,74 @@
+import asyncio
+
+from .swiftconnect import PeerError
+
+
+def _retrieve(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class MicroBatcher:
+
+    window = 0.002
+    max_size = 64
+
+    def __init__(self, fetch, key, window=None, max_size=None):
+        self.fetch = fetch
+        self.key = key
+        if window is not None:
+            self.window = window
+        if max_size is not None:
+            self.max_size = max_size
+        self.requests = 0
+        self.batches = 0
+        self._pending = {}
+        self._timer = None
+
+    async def get(self, id):
+        self.requests += 1
+        future = self._pending.get(id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._pending[id] = loop.create_future()
+            future.add_done_callback(_retrieve)
+            if len(self._pending) >= self.max_size:
+                self.flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self.flush)
+        return await asyncio.shield(future)
+
+    def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending):
+        self.batches += 1
+        try:
+            results = {self.key(result): result
+                       for result in await self.fetch(list(pending))}
+        except PeerError as exc:
+            if len(pending) == 1:
+                for future in pending.values():
+                    if not future.done():
+                        future.set_exception(exc)
+            else:
+                await asyncio.gather(*(self._run({id: future})
+                                       for id, future in pending.items()))
+            return
+        except Exception as exc:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for id, future in pending.items():
+            if future.done():
+                continue
+            if id in results:
+                future.set_result(results[id])
+            else:
+                future.set_exception(KeyError(id))
@@ -0,0 +1,398 @@
+import argparse
+import asyncio
+import concurrent.futures
+import os
+import ssl
+import statistics
+import tempfile
+import time
+import uuid
+
+from . import eventloop
+from .data import UUID
+from .sslsession import SSLSessionCache
+from .swiftconnect import LocalInterface, Peer, SwiftConnectProtocol
+from .transport import PROFILES
+from .utmconfiguration import (
+    UTMBackend, UTMConfigurationInfo, UTMQemuConfiguration)
+from .utmremoteclient import ClientIdentity, UTMRemoteClient
+from .utmremotemessage import UTMRemoteMessageServer as SM
+from .utmremotemessage import (
+    ServerInformation, UTMVirtualMachineState, VirtualMachineInformation)
+
+
+class BenchServer:
+
+    class Local(LocalInterface):
+
+        def __init__(self, server):
+            self.server = server
+            self.peer = None
+
+        def connectionLost(self, error):
+            self.server.peers.discard(self.peer)
+
+        async def handle(self, message, data):
+            vms = self.server.vms
+            if message == SM.serverHandshake:
+                return SM.ServerHandshake.Reply(
+                    version=1, isAuthenticated=True, capabilities=0,
+                    model="bench").encode()
+            elif message == SM.listVirtualMachines:
+                return SM.ListVirtualMachines.Reply(ids=list(vms)).encode()
+            elif message == SM.getVirtualMachineInformation:
+                req = SM.GetVirtualMachineInformation.Request(data)
+                return SM.GetVirtualMachineInformation.Reply(
+                    informations=[vms[id] for id in req.ids]).encode()
+            elif message == SM.startVirtualMachine:
+                req = SM.StartVirtualMachine.Request(data)
+                vms[req.id].state = UTMVirtualMachineState.started
+                return SM.StartVirtualMachine.Reply(
+                    serverInfo=ServerInformation(
+                        spicePortInternal=0, spicePortExternal=0,
+                        spiceHostExternal="", spicePublicKey=b"",
+                        spicePassword="")).encode()
+            elif message == SM.getQEMUConfiguration:
+                req = SM.GetQEMUConfiguration.Request(data)
+                return SM.GetQEMUConfiguration.Reply(
+                    configuration=UTMQemuConfiguration(
+                        Information=UTMConfigurationInfo(
+                            Name=vms[req.id].name),
+                        Backend=UTMBackend.qemu,
+                        ConfigurationVersion=4)).encode()
+            elif message == SM.getPackageFile:
+                return SM.GetPackageFile.Reply(
+                    data=self.server.payload, lastModified="").encode()
+            elif message in (SM.stopVirtualMachine, SM.pauseVirtualMachine,
+                             SM.resumeVirtualMachine,
+                             SM.restartVirtualMachine,
+                             SM.saveSnapshotVirtualMachine):
+                return SM.StopVirtualMachine.Reply().encode()
+            else:
+                raise ValueError(f"Message ID '{message}' is unsupported.")
+
+    def __init__(self, vm_count=16, payload_size=0):
+        self.payload = bytes(payload_size)
+        self.vms = {}
+        for i in range(vm_count):
+            id = UUID(str(uuid.uuid4()).upper())
+            self.vms[id] = VirtualMachineInformation(
+                id=id, name=f"bench-{i}", path=f"/bench/bench-{i}.utm",
+                isShortcut=False, isSuspended=False, isTakeoverAllowed=True,
+                backend=UTMBackend.qemu, state=UTMVirtualMachineState.stopped,
+                mountedDrives={})
+        self.server = None
+        self.peers = set()
+
+    def _protocol(self):
+        local = self.Local(self)
+        local.peer = peer = Peer(local)
+        peer.is_trusted = True
+        self.peers.add(peer)
+        return SwiftConnectProtocol(peer)
+
+    async def notify(self, message, **parameters):
+        await asyncio.gather(*(
+            message.send(message.Request(**parameters), peer)
+            for peer in list(self.peers)))
+
+    async def start(self, certificate, client_certificate=None,
+                    host="127.0.0.1", port=0):
+        ssl_context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLS_SERVER)
+        ssl_context.load_cert_chain(certificate, password='password')
+        if client_certificate is not None:
+            ssl_context.load_verify_locations(client_certificate)
+            ssl_context.verify_mode = ssl.CERT_REQUIRED
+        self.server = await asyncio.get_running_loop().create_server(
+            self._protocol, host, port, ssl=ssl_context)
+        return self.server.sockets[0].getsockname()[:2]
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+
+
+def _percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples)-1, int(len(samples)*fraction))]
+
+
+def report(title, samples=None, **values):
+    line = f"{title:32}"
+    if samples:
+        line += (f" median {statistics.median(samples)*1e6:9.1f}us"
+                 f" p99 {_percentile(samples, 0.99)*1e6:9.1f}us")
+    for key, value in values.items():
+        line += f" {key} {value:.1f}" if isinstance(value, float) \
+            else f" {key} {value}"
+    print(line)
+
+
+async def rpc_latency(client, count):
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await client.remote.listVirtualMachines()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def frame_throughput(client, count, concurrency):
+    request = SM.GetVirtualMachineInformation.Request(
+        ids=await client.remote.listVirtualMachines())
+    remaining = count
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await client.remote._getVirtualMachineInformation(request)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return count / (time.perf_counter() - start)
+
+
+async def connect_client(args, address, **kwargs):
+    client = UTMRemoteClient(args.cert, **kwargs)
+    await client.connect(address, expected_fingerprint=lambda fp: None)
+    return client
+
+
+async def transfer_throughput(client, count):
+    ids = await client.remote.listVirtualMachines()
+    total = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        data, _ = await client.remote.getPackageFile(ids[0], ["disk.img"])
+        total += len(data)
+    return total / (time.perf_counter() - start) / (1 << 20)
+
+
+async def connect_latency(args, address, client=None):
+    if client is None:
+        client = UTMRemoteClient(args.cert)
+    samples = []
+    for _ in range(args.connects):
+        start = time.perf_counter()
+        await client.connect(address, expected_fingerprint=lambda fp: None)
+        samples.append(time.perf_counter() - start)
+        client.close()
+    return samples
+
+
+async def _bench_loop(args):
+    server = BenchServer(args.vms)
+    address = await server.start(args.server_cert, args.cert)
+    try:
+        client = await connect_client(args, address)
+        with client:
+            report("rpc latency", await rpc_latency(client, args.count))
+            report("frame throughput", frames_per_s=await frame_throughput(
+                client, args.count, args.concurrency))
+    finally:
+        server.close()
+
+
+def bench_loop(args):
+    for backend in args.backends:
+        resolved = eventloop.resolve_backend(backend)
+        if resolved != backend:
+            print(f"skipping {backend}")
+            continue
+        print(f"-- event loop: {backend}")
+        eventloop.run(_bench_loop(args), backend)
+
+
+async def _bench_resume(args):
+    server = BenchServer(args.vms)
+    address = await server.start(args.server_cert, args.cert)
+    try:
+        for title, cache in (("full handshake",
+                              SSLSessionCache(max_entries=0)),
+                             ("resumed handshake", SSLSessionCache())):
+            client = UTMRemoteClient(args.cert, session_cache=cache)
+            samples = await connect_latency(args, address, client)
+            report(title, samples, hit_rate=cache.hit_rate)
+    finally:
+        server.close()
+
+
+def bench_resume(args):
+    eventloop.run(_bench_resume(args), args.event_loop)
+
+
+async def _setup_latency(args, address, make_client):
+    samples = []
+    for _ in range(args.connects):
+        start = time.perf_counter()
+        with make_client() as client:
+            await client.connect(address,
+                                 expected_fingerprint=lambda fp: None)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def _bench_identity(args):
+    server = BenchServer(args.vms)
+    address = await server.start(args.server_cert, args.cert)
+    identity = ClientIdentity(args.cert)
+    try:
+        report("per-client identity", await _setup_latency(
+            args, address,
+            lambda: UTMRemoteClient(ClientIdentity(args.cert))))
+        report("shared identity", await _setup_latency(
+            args, address, lambda: UTMRemoteClient(
+                identity, session_cache=SSLSessionCache(max_entries=0))))
+        report("shared identity, resumed", await _setup_latency(
+            args, address, lambda: UTMRemoteClient(identity)))
+    finally:
+        server.close()
+
+
+def bench_identity(args):
+    eventloop.run(_bench_identity(args), args.event_loop)
+
+
+async def _bench_transport(args):
+    server = BenchServer(args.vms, args.payload << 20)
+    address = await server.start(args.server_cert, args.cert)
+    try:
+        for name in args.profiles:
+            print(f"-- transport profile: {name}")
+            client = await connect_client(
+                args, address, transport_options=PROFILES.get(name))
+            with client:
+                report("rpc latency", await rpc_latency(client, args.count))
+                report("frame throughput",
+                       frames_per_s=await frame_throughput(
+                           client, args.count, args.concurrency))
+                report("transfer throughput",
+                       mib_per_s=await transfer_throughput(
+                           client, args.transfers))
+    finally:
+        server.close()
+
+
+def bench_transport(args):
+    eventloop.run(_bench_transport(args), args.event_loop)
+
+
+async def _monitor_lag(samples, interval=0.001):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(loop.time() - start - interval)
+
+
+async def loop_lag(client, count):
+    ids = await client.remote.listVirtualMachines()
+    samples = []
+    monitor = asyncio.create_task(_monitor_lag(samples))
+    start = time.perf_counter()
+    for _ in range(count):
+        await client.remote.getVirtualMachineInformation(ids)
+    elapsed = time.perf_counter() - start
+    monitor.cancel()
+    return samples, count / elapsed
+
+
+async def _bench_offload(args, address):
+    threshold = args.threshold << 10
+    with concurrent.futures.ProcessPoolExecutor() as processes:
+        for title, kwargs in (
+                ("inline", dict(offload_threshold=None)),
+                ("thread pool", dict(offload_threshold=threshold)),
+                ("process pool", dict(offload_threshold=threshold,
+                                      offload_executor=processes))):
+            client = await connect_client(args, address, **kwargs)
+            with client:
+                samples, rate = await loop_lag(client, args.count)
+                report(title, samples, max_lag_ms=max(samples)*1e3,
+                       replies_per_s=rate,
+                       offloaded=client.peer.offloaded)
+
+
+def bench_offload(args):
+    server = BenchServer(args.vms)
+    server_loop = eventloop.EventLoopThread(args.event_loop,
+                                            name="bench-server")
+    try:
+        address = server_loop.run(
+            server.start(args.server_cert, args.cert))
+        eventloop.run(_bench_offload(args, address), args.event_loop)
+        server_loop.call(server.close)
+    finally:
+        server_loop.stop()
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("python -m utmremote.bench",
+                                     description="Benchmark the remote "
+                                     "protocol client against a local "
+                                     "loopback server")
+    parser.add_argument('--cert', '-c',
+                        help="client certificate to use (PEM format, "
+                        "generated if not given)")
+    parser.add_argument('--server-cert',
+                        help="server certificate to use (PEM format, "
+                        "generated if not given)")
+    parser.add_argument('--vms', type=int, default=16,
+                        help="number of virtual machines on the server")
+    parser.add_argument('--count', '-n', type=int, default=2000,
+                        help="number of requests per measurement")
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help="number of concurrent requests for throughput")
+    parser.add_argument('--connects', type=int, default=50,
+                        help="number of connections per measurement")
+    parser.add_argument('--event-loop', '-E', choices=eventloop.BACKENDS,
+                        help="event loop implementation to use")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    loop = subparsers.add_parser('loop', help="compare event loop backends")
+    loop.add_argument('--backends', nargs='+',
+                      default=["asyncio", "uvloop"],
+                      choices=["asyncio", "uvloop"])
+    loop.set_defaults(func=bench_loop)
+    resume = subparsers.add_parser('resume',
+                                   help="measure TLS session resumption")
+    resume.set_defaults(func=bench_resume)
+    identity = subparsers.add_parser('identity',
+                                     help="measure connection setup cost "
+                                     "with and without a shared identity")
+    identity.set_defaults(func=bench_identity)
+    transport = subparsers.add_parser('transport',
+                                      help="compare transport profiles")
+    transport.add_argument('--profiles', nargs='+',
+                           default=["default"] + list(PROFILES),
+                           choices=["default"] + list(PROFILES))
+    transport.add_argument('--payload', type=int, default=16,
+                           help="package file size in MiB")
+    transport.add_argument('--transfers', type=int, default=8,
+                           help="number of package file transfers")
+    transport.set_defaults(func=bench_transport)
+    offload = subparsers.add_parser('offload',
+                                    help="measure event loop lag with and "
+                                    "without offloaded reply decoding")
+    offload.add_argument('--threshold', type=int, default=64,
+                         help="offload threshold in KiB")
+    offload.set_defaults(func=bench_offload)
+    return parser
+
+
+def main(argv):
+    args = make_parser().parse_args(argv[1:])
+    with tempfile.TemporaryDirectory() as tmpdir:
+        from .gencert import generate_certificate_file
+        for attr, name in (('cert', "client.pem"),
+                           ('server_cert', "server.pem")):
+            if getattr(args, attr) is None:
+                setattr(args, attr, os.path.join(tmpdir, name))
+                generate_certificate_file(getattr(args, attr))
+        args.func(args)
+
+
+if __name__ == "__main__":
+    import sys
+    main(sys.argv)
@@ -0,0 +1,81 @@
+import asyncio
+
+
+class BulkResult:
+
+    def __init__(self, id, result=None, exception=None, elapsed=None):
+        self.id = id
+        self.result = result
+        self.exception = exception
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.exception is None
+
+    def get(self):
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+    def __repr__(self):
+        if self.exception is not None:
+            return f"BulkResult({self.id!r}, exception={self.exception!r})"
+        return f"BulkResult({self.id!r}, result={self.result!r})"
+
+
+class BulkOperation:
+
+    def __init__(self, op, ids, args=(), concurrency=16, timeout=None):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.op = op
+        self.ids = list(ids)
+        self.args = args
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.results = {}
+        self._started = False
+
+    async def _run_one(self, id, semaphore):
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            start = loop.time()
+            try:
+                result = self.op(id, *self.args)
+                if self.timeout is not None:
+                    result = asyncio.wait_for(result, self.timeout)
+                result = await result
+            except Exception as exc:
+                return BulkResult(id, exception=exc,
+                                  elapsed=loop.time() - start)
+            return BulkResult(id, result, elapsed=loop.time() - start)
+
+    async def __aiter__(self):
+        if self._started:
+            raise RuntimeError("Bulk operation already started")
+        self._started = True
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self._run_one(id, semaphore))
+                 for id in self.ids]
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                self.results[result.id] = result
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def wait(self):
+        async for _ in self:
+            pass
+        return {id: self.results[id] for id in self.ids}
+
+    def __await__(self):
+        return self.wait().__await__()
+
+    @property
+    def failures(self):
+        return {id: result.exception for id, result in self.results.items()
+                if not result.ok}
@@ -1,14 +1,14 @@
 import argparse
-import asyncio
+import os
 import sys
 import urllib.parse
 
-from . import (
-    UTMRemoteClient, UTMVirtualMachineStopMethod,
-    UTMVirtualMachineStartOptions)
+from . import daemon, eventloop
+from .transport import PROFILES
+from . import UTMRemoteClient
 
 
-async def async_main(argv):
+def make_parser():
     parser = argparse.ArgumentParser("python -m utmremote.cli",
                                      description="Connect to UTM using "
                                      "remote protocol")
@@ -32,15 +32,39 @@ async def async_main(argv):
                         help="pause a virtual machine")
     parser.add_argument('--resume', action='append',
                         help="resume a virtual machine")
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help="number of virtual machines to operate on "
+                        "concurrently")
     parser.add_argument('--generate', '-g', help="generate a new cert",
                         action='store_true')
     parser.add_argument('--spice-cert', '-C',
                         help="save SPICE server certificate to "
                         "this file (PEM format)")
+    parser.add_argument('--transport-profile', choices=list(PROFILES),
+                        help="socket and TLS tuning profile to use")
+    parser.add_argument('--event-loop', '-E', choices=eventloop.BACKENDS,
+                        help="event loop implementation to use (default "
+                        f"from ${eventloop.ENVIRONMENT_VARIABLE} or asyncio)")
+    parser.add_argument('--no-daemon', action='store_true',
+                        help="always connect directly instead of through "
+                        "python -m utmremote.daemon")
+    parser.add_argument('--daemon-socket',
+                        help="Unix socket of the daemon (default "
+                        "pyutmremote/daemon.sock in $XDG_RUNTIME_DIR)")
+    parser.add_argument('--daemon-timeout', type=float, default=60.0,
+                        help="seconds to wait for the daemon before "
+                        "connecting directly")
     parser.add_argument('--debug', '-d', help="enable debug",
                         action='store_true')
+    return parser
+
+
+VERBS = dict(pause="Pausing", stop="Stopping", restart="Restarting",
+             start="Starting", resume="Resuming")
 
-    args = parser.parse_args()
+
+async def async_main(argv):
+    args = make_parser().parse_args()
     if not args.debug:
         sys.tracebacklimit = 0
 
@@ -48,60 +72,71 @@ async def async_main(argv):
         from .gencert import generate_certificate_file
         generate_certificate_file(args.cert)
 
-    with UTMRemoteClient(args.cert, debug=args.debug) as client:
-        await client.connect((args.server, args.port),
-                             args.password, args.fingerprint)
-        if args.start is None and args.stop is None and args.restart is None \
-           and args.pause is None and args.resume is None:
-            for vminfo in await client.remote.getVirtualMachineInformation(
-                    await client.remote.listVirtualMachines()):
-                print(f"{vminfo.id} {vminfo.name:32} {vminfo.state.name}")
-        else:
-            if args.pause is not None:
-                for vm in args.pause:
-                    print(f"Pausing {vm}")
-                    await client.remote.pauseVirtualMachine(vm)
-            if args.stop is not None:
-                for vm in args.stop:
-                    print(f"Stopping {vm}")
-                    await client.remote.stopVirtualMachine(
-                        vm, UTMVirtualMachineStopMethod.request)
-            if args.restart is not None:
-                for vm in args.restart:
-                    print(f"Restarting {vm}")
-                    await client.remote.restartVirtualMachine(vm)
-            if args.start is not None:
-                for vm in args.start:
-                    print(f"Starting {vm}")
-                    info = await client.remote.startVirtualMachine(vm, 0)
-                    if info.spicePortExternal:
-                        host = info.spiceHostExternal
-                        port = info.spicePortExternal
-                    else:
-                        host = args.server
-                        port = info.spicePortInternal
-                    if port:
-                        if args.spice_cert:
-                            spice_cert = await client.get_spice_cert(
-                                (host, port), info.spicePublicKey)
-                            with open(args.spice_cert, "w") as f:
-                                f.write(spice_cert)
-                                print("Wrote SPICE server certificate to "
-                                      f"{args.spice_cert}")
-                        url = urllib.parse.urlunparse((
-                            'spice', '['+host+']' if ':' in host else host,
-                            '', '', urllib.parse.urlencode(
-                                [('tls-port', port),
-                                 ('password', info.spicePassword)]), ''))
-                        print(f"SPICE URL: {url}")
-            if args.resume is not None:
-                for vm in args.resume:
-                    print(f"Resuming {vm}")
-                    await client.remote.resumeVirtualMachine(vm)
+    actions = [(command, getattr(args, command)) for command in VERBS
+               if getattr(args, command) is not None] or [('list', None)]
+    message = dict(cert=os.path.abspath(args.cert), server=args.server,
+                   port=args.port, password=args.password,
+                   fingerprint=args.fingerprint, actions=actions,
+                   concurrency=args.concurrency,
+                   spice_cert=bool(args.spice_cert))
+    reply = None
+    if not (args.no_daemon or args.generate or args.debug):
+        reply = await daemon.request(message, args.daemon_socket,
+                                     args.daemon_timeout)
+    if reply is not None:
+        if args.fingerprint is None and reply['fingerprint'] is not None:
+            print(f"connection fingerprint: {reply['fingerprint']}")
+        results = reply['result']
+    else:
+        with UTMRemoteClient(args.cert, debug=args.debug,
+                             transport_options=PROFILES.get(
+                                 args.transport_profile),
+                             prefetch_spice_certificates=bool(
+                                 args.spice_cert)) as client:
+            await client.connect((args.server, args.port),
+                                 args.password, args.fingerprint)
+            if actions[0][0] == 'list':
+                async for vminfo in \
+                        client.remote.iterVirtualMachineInformation(
+                            ordered=True):
+                    print(f"{vminfo.id} {vminfo.name:32} "
+                          f"{vminfo.state.name}")
+                return
+            results = await daemon.execute(client, message)
+
+    failed = False
+    for (command, vms), replies in zip(actions, results):
+        if command == 'list':
+            for id, name, state in replies:
+                print(f"{id} {name:32} {state}")
+            continue
+        verb = VERBS[command]
+        for vm in vms:
+            print(f"{verb} {vm}")
+        for reply in replies:
+            if 'error' in reply:
+                print(f"{verb} {reply['id']} failed: {reply['error']}")
+                failed = True
+            elif reply.get('spice') is not None:
+                host, port = reply['spice']
+                if args.spice_cert:
+                    with open(args.spice_cert, "w") as f:
+                        f.write(reply['certificate'])
+                        print("Wrote SPICE server certificate to "
+                              f"{args.spice_cert}")
+                url = urllib.parse.urlunparse((
+                    'spice', '['+host+']' if ':' in host else host,
+                    '', '', urllib.parse.urlencode(
+                        [('tls-port', port),
+                         ('password', reply['password'])]), ''))
+                print(f"SPICE URL: {url}")
+    if failed:
+        sys.exit(1)
 
 
 def main(argv):
-    asyncio.run(async_main(argv))
+    args = make_parser().parse_args()
+    eventloop.run(async_main(argv), args.event_loop)
 
 
 if __name__ == "__main__":
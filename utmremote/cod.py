@@ -107,7 +107,10 @@ class CodDecoder:
                         elen = self.data.popUleb128()
                         offsets.append(slice(offset, offset+elen))
                         offset += ellen
-            if self.type == bytes:
+            if self.type == bytes and len(offsets) == 1 and \
+               offsets[0] is not None:
+                values = self.data[offsets[0]].view()
+            elif self.type == bytes:
                 values = b''.join([bytes(self.data[pos])
                                    for pos in offsets if pos is not None])
             else:
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+
+from . import eventloop
+from .paths import get_user_runtime_path
+from .pool import UTMRemotePool
+from .transport import PROFILES
+from .utmremotemessage import UTMVirtualMachineStopMethod
+
+ACTIONS = dict(
+    pause=('pauseVirtualMachine',),
+    stop=('stopVirtualMachine', UTMVirtualMachineStopMethod.request),
+    restart=('restartVirtualMachine',),
+    start=('startVirtualMachine', 0),
+    resume=('resumeVirtualMachine',))
+
+
+class DaemonError(Exception):
+    pass
+
+
+def socket_path():
+    return get_user_runtime_path("daemon.sock")
+
+
+def _certificate_key(certificate):
+    path = os.path.realpath(certificate)
+    return path, os.stat(path).st_mtime_ns
+
+
+async def _started(client, info, spice_cert):
+    server = client.spice_server(info)
+    reply = dict(spice=server and list(server), password=info.spicePassword)
+    if server is not None and spice_cert:
+        reply['certificate'] = await client.spice_certificates.get(
+            server, info.spicePublicKey)
+    return reply
+
+
+async def execute(client, request):
+    results = []
+    for command, ids in request['actions']:
+        if command == 'list':
+            results.append([[str(info.id), info.name, info.state.name]
+                            for info in await client.inventory.get()])
+            continue
+        method, *args = ACTIONS[command]
+        replies = []
+        async for result in client.remote.bulk(
+                method, ids, *args,
+                concurrency=request.get('concurrency', 16)):
+            if not result.ok:
+                reply = dict(error=str(result.exception))
+            elif command == 'start':
+                reply = await _started(client, result.result,
+                                       request.get('spice_cert'))
+            else:
+                reply = {}
+            replies.append(dict(id=result.id, **reply))
+        results.append(replies)
+    return results
+
+
+async def request(message, path=None, timeout=60.0):
+    try:
+        async with asyncio.timeout(timeout):
+            reader, writer = await asyncio.open_unix_connection(
+                str(path or socket_path()))
+            try:
+                writer.write(json.dumps(message).encode() + b"\n")
+                await writer.drain()
+                line = await reader.readline()
+            finally:
+                writer.close()
+    except (OSError, TimeoutError):
+        return None
+    if not line:
+        raise DaemonError("Daemon closed the connection")
+    reply = json.loads(line)
+    if reply.get('fallback'):
+        return None
+    if not reply['ok']:
+        raise DaemonError(reply['error'])
+    return reply
+
+
+class ControlDaemon:
+
+    def __init__(self, certificate, idle_timeout=None, **client_kwargs):
+        self.certificate = _certificate_key(certificate)
+        self.pool = UTMRemotePool(certificate, idle_timeout=idle_timeout,
+                                  prefetch_spice_certificates=False,
+                                  **client_kwargs)
+        self.requests = 0
+        self.path = None
+
+    async def _client(self, message):
+        server = (message['server'], int(message['port']))
+        host = self.pool.hosts.get(server) or \
+            self.pool.add_host(server, server)
+        if message.get('password') is not None:
+            host.password = message['password']
+        fingerprint = message.get('fingerprint')
+        if fingerprint:
+            fingerprint = bytes.fromhex(fingerprint.replace(':', ''))
+            if host.fingerprint is None:
+                host.fingerprint = fingerprint
+            elif host.fingerprint != fingerprint:
+                raise ConnectionError("Fingerprint mismatch")
+        try:
+            return await self.pool.get(server)
+        except Exception:
+            if not host.connects:
+                host.fingerprint = None
+            raise
+
+    async def _reply(self, message):
+        try:
+            certificate = _certificate_key(message['cert'])
+        except OSError:
+            certificate = None
+        if certificate != self.certificate:
+            return dict(ok=False, fallback=True,
+                        error="Daemon uses a different certificate")
+        self.requests += 1
+        try:
+            client = await self._client(message)
+            fingerprint = client.connection_fingerprint
+            return dict(ok=True, result=await execute(client, message),
+                        fingerprint=fingerprint and
+                        fingerprint.hex(':', 1).upper())
+        except Exception as error:
+            return dict(ok=False, error=str(error) or type(error).__name__)
+
+    async def handle(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    message = json.loads(line)
+                except ValueError as error:
+                    reply = dict(ok=False, error=str(error))
+                else:
+                    reply = await self._reply(message)
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path=None):
+        path = str(path or socket_path())
+        try:
+            _, writer = await asyncio.open_unix_connection(path)
+        except OSError:
+            if os.path.exists(path):
+                os.unlink(path)
+        else:
+            writer.close()
+            raise DaemonError(f"Daemon already listening on {path}")
+        if self.pool.idle_timeout:
+            await self.pool.start()
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self.handle, path)
+        finally:
+            os.umask(umask)
+        self.path = path
+        return server
+
+    def stats(self):
+        return dict(requests=self.requests, hosts=self.pool.stats())
+
+    def close(self):
+        self.pool.close()
+        if self.path is not None:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("python -m utmremote.daemon",
+                                     description="Keep UTM connections open "
+                                     "for python -m utmremote.cli")
+    parser.add_argument('--cert', '-c', required=True,
+                        help="client certificate to use (PEM format)")
+    parser.add_argument('--socket', default=None,
+                        help="Unix socket to listen on (default "
+                        "pyutmremote/daemon.sock in $XDG_RUNTIME_DIR)")
+    parser.add_argument('--idle-timeout', type=float, default=None,
+                        help="close connections unused for this many "
+                        "seconds")
+    parser.add_argument('--heartbeat-interval', type=float, default=30.0,
+                        help="seconds of idle time before probing a "
+                        "connection")
+    parser.add_argument('--transport-profile', choices=list(PROFILES),
+                        help="socket and TLS tuning profile to use")
+    parser.add_argument('--event-loop', '-E', choices=eventloop.BACKENDS,
+                        help="event loop implementation to use")
+    return parser
+
+
+async def async_main(args):
+    with ControlDaemon(args.cert, args.idle_timeout,
+                       heartbeat_interval=args.heartbeat_interval,
+                       transport_options=PROFILES.get(
+                           args.transport_profile)) as daemon:
+        server = await daemon.serve(args.socket)
+        stop = asyncio.Event()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM,
+                                                      stop.set)
+        async with server:
+            await stop.wait()
+
+
+def main(argv):
+    args = make_parser().parse_args(argv[1:])
+    try:
+        eventloop.run(async_main(args), args.event_loop)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    import sys
+    main(sys.argv)
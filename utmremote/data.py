@@ -1,10 +1,14 @@
 import ctypes
+import mmap
 
 
 class Data:
 
     def __init__(self, data=None, offset=0, end=None):
-        data = bytearray() if data is None else bytes(data)
+        if data is None:
+            data = bytearray()
+        elif not isinstance(data, (bytes, mmap.mmap)):
+            data = bytes(data)
         self.data = data
         self.offset = offset
         self.end = len(data) if end is None else end
@@ -15,6 +19,11 @@ class Data:
     def __bytes__(self):
         return bytes(self.data[self.offset:self.end])
 
+    def view(self):
+        if isinstance(self.data, mmap.mmap):
+            return memoryview(self.data)[self.offset:self.end]
+        return bytes(self)
+
     def __getitem__(self, offset):
         if isinstance(offset, slice):
             if offset.step is not None:
@@ -0,0 +1,92 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import warnings
+
+ENVIRONMENT_VARIABLE = "UTMREMOTE_EVENT_LOOP"
+BACKENDS = ("asyncio", "uvloop", "auto")
+
+
+def _have_uvloop():
+    try:
+        import uvloop  # noqa: F401
+    except ModuleNotFoundError:
+        return False
+    return True
+
+
+def resolve_backend(backend=None):
+    if backend is None:
+        backend = os.environ.get(ENVIRONMENT_VARIABLE, "").strip()
+    backend = backend.lower() or "asyncio"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown event loop backend '{backend}'")
+    if backend == "auto":
+        return "uvloop" if _have_uvloop() else "asyncio"
+    if backend == "uvloop" and not _have_uvloop():
+        warnings.warn("uvloop is not installed, using asyncio event loop",
+                      RuntimeWarning, stacklevel=2)
+        return "asyncio"
+    return backend
+
+
+def new_event_loop(backend=None):
+    if resolve_backend(backend) == "uvloop":
+        import uvloop
+        return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def loop_factory(backend=None):
+    backend = resolve_backend(backend)
+    return lambda: new_event_loop(backend)
+
+
+def run(main, backend=None, debug=None):
+    with asyncio.Runner(debug=debug,
+                        loop_factory=loop_factory(backend)) as runner:
+        return runner.run(main)
+
+
+class EventLoopThread:
+
+    def __init__(self, backend=None, name="utmremote-event-loop"):
+        self._loop = new_event_loop(backend)
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def loop(self):
+        return self._loop
+
+    def in_loop_thread(self):
+        return threading.current_thread() is self._thread
+
+    def run_coroutine(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro, timeout=None):
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("Blocking call from the event loop thread")
+        future = self.run_coroutine(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def call(self, func, *args):
+        async def call():
+            return func(*args)
+        return self.run(call())
+
+    def stop(self):
+        if self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if not self.in_loop_thread():
+            self._thread.join()
+            self._loop.close()
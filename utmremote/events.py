@@ -0,0 +1,109 @@
+import asyncio
+import collections
+
+from .utmremotemessage import UTMRemoteMessageClient as CM
+
+
+class EventStream:
+
+    OVERFLOW_POLICIES = ("coalesce", "drop_oldest", "drop_newest")
+
+    def __init__(self, max_size=256, overflow="coalesce", on_close=None):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}'")
+        self.max_size = max_size
+        self.overflow = overflow
+        self.received = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.closed = False
+        self._on_close = on_close
+        self._events = collections.deque()
+        self._transitions = {}
+        self._waiters = []
+
+    def __len__(self):
+        return len(self._events)
+
+    def _wakeup(self):
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _coalesce(self, event):
+        if isinstance(event, CM.VirtualMachineDidTransition.Request):
+            pending = self._transitions.get(event.id)
+            if pending is not None:
+                pending.state = event.state
+                pending.isTakeoverAllowed = event.isTakeoverAllowed
+                return True
+        elif isinstance(event, CM.ListHasChanged.Request):
+            if self._events and \
+               isinstance(self._events[-1], CM.ListHasChanged.Request):
+                self._events[-1].ids = event.ids
+                return True
+        return False
+
+    def put(self, event):
+        if self.closed:
+            return
+        self.received += 1
+        if self.max_size is not None and \
+           len(self._events) >= self.max_size:
+            if self.overflow == "coalesce" and self._coalesce(event):
+                self.coalesced += 1
+                return
+            self.dropped += 1
+            if self.overflow == "drop_newest":
+                return
+            self._forget(self._events.popleft())
+        self._events.append(event)
+        if isinstance(event, CM.VirtualMachineDidTransition.Request):
+            self._transitions[event.id] = event
+        self._wakeup()
+
+    def _forget(self, event):
+        if isinstance(event, CM.VirtualMachineDidTransition.Request) and \
+           self._transitions.get(event.id) is event:
+            del self._transitions[event.id]
+        return event
+
+    def get_nowait(self):
+        return self._forget(self._events.popleft())
+
+    async def get(self):
+        while not self._events:
+            if self.closed:
+                raise StopAsyncIteration
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        return self.get_nowait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    def stats(self):
+        return dict(received=self.received, coalesced=self.coalesced,
+                    dropped=self.dropped, pending=len(self._events))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self._on_close is not None:
+                self._on_close(self)
+            self._wakeup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
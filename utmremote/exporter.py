@@ -0,0 +1,227 @@
+import argparse
+import asyncio
+import collections
+import json
+
+from . import eventloop
+from .pool import UTMRemotePool
+from .utmconfiguration import UTMBackend
+from .utmremotemessage import UTMVirtualMachineState
+
+DEFAULT_PORT = 21589
+
+
+def _parse_host(spec):
+    name, _, address = spec.rpartition('=')
+    port = DEFAULT_PORT
+    if address.startswith('['):
+        address, _, rest = address[1:].partition(']')
+        if rest.startswith(':'):
+            port = int(rest[1:])
+    elif address.count(':') == 1:
+        address, port = address.split(':')
+        port = int(port)
+    return name or address, address, port
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+class Metrics:
+
+    def __init__(self):
+        self.families = {}
+
+    def add(self, name, kind, help, value, **labels):
+        family = self.families.setdefault(
+            name, [f"# HELP {name} {help}", f"# TYPE {name} {kind}"])
+        if labels:
+            name += "{" + ",".join(f'{key}="{_label(label)}"'
+                                   for key, label in labels.items()) + "}"
+        family.append(f"{name} {value}")
+
+    def render(self):
+        return "".join(line + "\n" for family in self.families.values()
+                       for line in family)
+
+
+class Exporter:
+
+    def __init__(self, pool, refresh_interval=30.0):
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self.scrapes = 0
+        self._task = None
+
+    async def _refresh_host(self, name):
+        client = await self.pool.get(name)
+        if not client.inventory.loaded:
+            await client.inventory.refresh()
+        await self.pool.ping(name)
+
+    async def _refresh(self):
+        while True:
+            await asyncio.gather(*(self._refresh_host(name)
+                                   for name in self.pool.hosts),
+                                 return_exceptions=True)
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh())
+
+    def collect(self):
+        metrics = Metrics()
+        for name, host in self.pool.hosts.items():
+            inventory = host.client.inventory \
+                if host.is_connected else None
+            up = inventory is not None and inventory.loaded
+            metrics.add("utmremote_up", "gauge",
+                        "Whether the host is connected and its inventory "
+                        "is loaded", int(up), host=name)
+            metrics.add("utmremote_connects_total", "counter",
+                        "Successful connections to the host",
+                        host.connects, host=name)
+            metrics.add("utmremote_connect_failures_total", "counter",
+                        "Failed connection attempts to the host",
+                        host.failures, host=name)
+            if host.connect_time is not None:
+                metrics.add("utmremote_connect_seconds", "gauge",
+                            "Duration of the last connection setup",
+                            host.connect_time, host=name)
+            if host.latency is not None:
+                metrics.add("utmremote_rpc_latency_seconds", "gauge",
+                            "Moving average of the RPC round trip time",
+                            host.latency, host=name)
+            if not up:
+                continue
+            infos = [info for info in inventory.vminfos.values()
+                     if info is not None]
+            counts = collections.Counter(
+                (UTMVirtualMachineState(info.state), UTMBackend(info.backend))
+                for info in infos)
+            for state in UTMVirtualMachineState:
+                for backend in UTMBackend:
+                    metrics.add("utmremote_vms", "gauge",
+                                "Virtual machines by state and backend",
+                                counts[state, backend], host=name,
+                                state=state.name, backend=backend.name)
+            metrics.add("utmremote_vms_takeover_allowed", "gauge",
+                        "Virtual machines that allow takeover",
+                        sum(bool(info.isTakeoverAllowed) for info in infos),
+                        host=name)
+            metrics.add("utmremote_vms_suspended", "gauge",
+                        "Virtual machines with a suspended state",
+                        sum(bool(info.isSuspended) for info in infos),
+                        host=name)
+            metrics.add("utmremote_inventory_fetches_total", "counter",
+                        "Information requests issued by the inventory",
+                        inventory.fetches, host=name)
+        metrics.add("utmremote_exporter_scrapes_total", "counter",
+                    "Scrapes served by this exporter", self.scrapes)
+        return metrics.render()
+
+    async def handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            method, path, *_ = request.decode('latin-1').split() + ['', '']
+            if method == 'GET' and path.split('?')[0] == '/metrics':
+                self.scrapes += 1
+                status = "200 OK"
+                body = self.collect().encode()
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status = "404 Not Found"
+                body = b"Not found\n"
+                content_type = "text/plain"
+            writer.write(f"HTTP/1.0 {status}\r\n"
+                         f"Content-Type: {content_type}\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode()
+                         + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        self.start()
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.pool.close()
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("python -m utmremote.exporter",
+                                     description="Export virtual machine "
+                                     "state of UTM hosts as Prometheus "
+                                     "metrics")
+    parser.add_argument('--cert', '-c', required=True,
+                        help="client certificate to use (PEM format)")
+    parser.add_argument('--host', '-s', action='append', default=[],
+                        metavar='[NAME=]ADDRESS[:PORT]',
+                        help="UTM host to monitor")
+    parser.add_argument('--hosts',
+                        help="JSON file with a list of hosts (objects with "
+                        "address, port and optionally name, password and "
+                        "fingerprint)")
+    parser.add_argument('--password', '-P',
+                        help="password to authenticate with")
+    parser.add_argument('--listen', '-l', default="127.0.0.1:9817",
+                        metavar='ADDRESS:PORT',
+                        help="address to serve /metrics on")
+    parser.add_argument('--refresh-interval', type=float, default=30.0,
+                        help="seconds between reconnects and latency probes")
+    parser.add_argument('--heartbeat-interval', type=float, default=30.0,
+                        help="seconds of idle time before probing a "
+                        "connection")
+    parser.add_argument('--event-loop', '-E', choices=eventloop.BACKENDS,
+                        help="event loop implementation to use")
+    return parser
+
+
+async def async_main(args):
+    pool = UTMRemotePool(args.cert, heartbeat_interval=args.heartbeat_interval,
+                         prefetch_spice_certificates=False)
+    for spec in args.host:
+        name, address, port = _parse_host(spec)
+        pool.add_host(name, (address, port), args.password)
+    if args.hosts:
+        with open(args.hosts, encoding='utf-8') as f:
+            for info in json.load(f):
+                pool.add_host(info.get('name') or info['address'],
+                              (info['address'], info.get('port',
+                                                         DEFAULT_PORT)),
+                              info.get('password', args.password),
+                              info.get('fingerprint'))
+    if not pool.hosts:
+        raise SystemExit("No hosts given")
+    exporter = Exporter(pool, args.refresh_interval)
+    _, address, port = _parse_host(args.listen)
+    server = await exporter.serve(address, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        exporter.close()
+
+
+def main(argv):
+    args = make_parser().parse_args(argv[1:])
+    try:
+        eventloop.run(async_main(args), args.event_loop)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    import sys
+    main(sys.argv)
@@ -0,0 +1,289 @@
+import asyncio
+import itertools
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+
+from . import eventloop
+from .bulk import BulkResult
+from .pool import UTMRemotePool
+from .utmconfiguration import UTMBackend
+from .utmremotemessage import (
+    UTMVirtualMachineState, UTMVirtualMachineStopMethod)
+
+OPERATIONS = dict(
+    start='startVirtualMachine', stop='stopVirtualMachine',
+    restart='restartVirtualMachine', pause='pauseVirtualMachine',
+    resume='resumeVirtualMachine', snapshot='saveSnapshotVirtualMachine',
+    delete_snapshot='deleteSnapshotVirtualMachine',
+    restore_snapshot='restoreSnapshotVirtualMachine')
+
+
+def _row(info):
+    return (info.name, int(info.state), str(info.backend),
+            info.isTakeoverAllowed, info.isSuspended)
+
+
+def _portable(error):
+    try:
+        pickle.dumps(error)
+    except Exception:
+        return RuntimeError(repr(error))
+    return error
+
+
+class _Shard:
+
+    def __init__(self, conn, pool):
+        self.conn = conn
+        self.pool = pool
+        self.outbox = []
+
+    def emit(self, request, host, id, ok, value, elapsed=None):
+        if not self.outbox:
+            asyncio.get_running_loop().call_soon(self.flush)
+        self.outbox.append((request, host, id, ok,
+                            value if ok else _portable(value), elapsed))
+
+    def flush(self):
+        outbox, self.outbox = self.outbox, []
+        self.conn.send(outbox)
+
+    async def _list(self, request, host, ids, args):
+        client = await self.pool.get(host)
+        for info in await client.inventory.get():
+            if ids is None or info.id in ids:
+                self.emit(request, host, info.id, True, _row(info))
+
+    async def _operation(self, request, host, ids, command, args):
+        client = await self.pool.get(host)
+        if command == 'info':
+            op, compact = client.remote.getInfo, _row
+        elif command == 'start':
+            def compact(serverInfo):
+                return (client.spice_server(serverInfo),
+                        serverInfo.spicePassword)
+            op = client.remote.startVirtualMachine
+        else:
+            op, compact = getattr(client.remote, OPERATIONS[command]), None
+        async for result in client.remote.bulk(op, ids, *args):
+            value = result.result if result.ok else result.exception
+            if result.ok and compact is not None:
+                value = compact(value)
+            self.emit(request, host, result.id, result.ok, value,
+                      result.elapsed)
+
+    async def _host(self, request, host, ids, command, args):
+        start = time.perf_counter()
+        try:
+            if command == 'list':
+                await self._list(request, host, ids, args)
+            else:
+                await self._operation(request, host, ids, command, args)
+        except Exception as error:
+            self.emit(request, host, None, False, error,
+                      time.perf_counter() - start)
+
+    async def _run(self, request, command, targets, args):
+        await asyncio.gather(*(self._host(request, host, ids, command, args)
+                               for host, ids in targets.items()))
+        self.emit(request, None, None, True, None)
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        failures = await self.pool.start()
+        self.conn.send([(None, host, None, False, _portable(error), None)
+                        for host, error in failures.items()])
+        tasks = set()
+        while True:
+            try:
+                message = await loop.run_in_executor(None, self.conn.recv)
+            except EOFError:
+                message = None
+            if message is None:
+                break
+            task = asyncio.create_task(self._run(*message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        for task in tasks:
+            task.cancel()
+        self.pool.close()
+
+
+def _worker(conn, certificate, hosts, backend, pool_kwargs):
+    async def main():
+        pool = UTMRemotePool(certificate, **pool_kwargs)
+        for host in hosts:
+            pool.add_host(*host)
+        await _Shard(conn, pool).serve()
+    eventloop.run(main(), backend)
+
+
+class FleetExecutor:
+
+    def __init__(self, certificate, processes=None, backend=None,
+                 **pool_kwargs):
+        self.certificate = certificate
+        self.processes = processes or os.cpu_count() or 1
+        self.backend = backend
+        self.pool_kwargs = pool_kwargs
+        self.hosts = {}
+        self.shard_of = {}
+        self._shards = []
+        self._requests = {}
+        self._request_ids = itertools.count(1)
+        self._lost = {}
+        self._loop = None
+
+    def add_host(self, name, server, password=None, fingerprint=None):
+        if self._shards:
+            raise RuntimeError("Fleet executor already started")
+        if name in self.hosts:
+            raise ValueError(f"Host '{name}' already in fleet")
+        self.hosts[name] = (name, server, password, fingerprint)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        context = multiprocessing.get_context('spawn')
+        count = max(1, min(self.processes, len(self.hosts)))
+        shards = [[] for _ in range(count)]
+        for index, (name, host) in enumerate(self.hosts.items()):
+            shards[index % count].append(host)
+            self.shard_of[name] = index % count
+        ready = []
+        for index, hosts in enumerate(shards):
+            conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker, daemon=True,
+                args=(child_conn, self.certificate, hosts, self.backend,
+                      self.pool_kwargs))
+            process.start()
+            child_conn.close()
+            future = self._loop.create_future()
+            ready.append(future)
+            thread = threading.Thread(
+                target=self._read, args=(index, conn, future), daemon=True)
+            thread.start()
+            self._shards.append((process, conn, thread))
+        failures = {}
+        for results in await asyncio.gather(*ready):
+            failures.update((host, error)
+                            for _, host, _, _, error, _ in results)
+        return failures
+
+    def _read(self, index, conn, ready):
+        try:
+            self._loop.call_soon_threadsafe(ready.set_result, conn.recv())
+            while True:
+                self._loop.call_soon_threadsafe(self._dispatch, index,
+                                                conn.recv())
+        except (EOFError, OSError):
+            pass
+        if not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._shard_lost, index, ready)
+
+    def _dispatch(self, index, results):
+        for request, host, id, ok, value, elapsed in results:
+            if request in self._requests:
+                queue, per_shard = self._requests[request]
+                if host is None:
+                    per_shard.pop(index, None)
+                queue.put_nowait((host, id, ok, value, elapsed))
+
+    @staticmethod
+    def _fail_shard(queue, hosts, error):
+        for host in hosts:
+            queue.put_nowait((host, None, False, error, None))
+        queue.put_nowait((None, None, True, None, None))
+
+    def _shard_lost(self, index, ready=None):
+        if index in self._lost:
+            return
+        self._lost[index] = error = ConnectionError(
+            f"Fleet worker {index} exited")
+        if ready is not None and not ready.done():
+            ready.set_exception(error)
+        for queue, per_shard in self._requests.values():
+            if index in per_shard:
+                self._fail_shard(queue, per_shard.pop(index), error)
+
+    async def run(self, command, targets=None, *args):
+        if command != 'list' and command != 'info' and \
+           command not in OPERATIONS:
+            raise ValueError(f"Unknown fleet command '{command}'")
+        if targets is None:
+            targets = dict.fromkeys(self.hosts)
+        elif not isinstance(targets, dict):
+            grouped = {}
+            for host, id in targets:
+                grouped.setdefault(host, []).append(id)
+            targets = grouped
+        per_shard = {}
+        for host, ids in targets.items():
+            per_shard.setdefault(self.shard_of[host], {})[host] = ids
+        request = next(self._request_ids)
+        queue = asyncio.Queue()
+        self._requests[request] = (queue, per_shard)
+        pending = len(per_shard)
+        try:
+            for shard, shard_targets in list(per_shard.items()):
+                if shard in self._lost:
+                    self._fail_shard(queue, per_shard.pop(shard),
+                                     self._lost[shard])
+                    continue
+                try:
+                    self._shards[shard][1].send(
+                        (request, command, shard_targets, args))
+                except OSError:
+                    self._shard_lost(shard)
+            while pending:
+                host, id, ok, value, elapsed = await queue.get()
+                if host is None:
+                    pending -= 1
+                    continue
+                if ok and command in ('list', 'info'):
+                    value = (value[0], UTMVirtualMachineState(value[1]),
+                             UTMBackend(value[2]), *value[3:])
+                yield BulkResult((host, id), value if ok else None,
+                                 None if ok else value, elapsed)
+        finally:
+            del self._requests[request]
+
+    async def wait(self, command, targets=None, *args):
+        return [result async for result in self.run(command, targets, *args)]
+
+    def list(self, hosts=None):
+        return self.run('list', hosts and dict.fromkeys(hosts))
+
+    def info(self, targets):
+        return self.run('info', targets)
+
+    def start_vms(self, targets, options=0):
+        return self.run('start', targets, options)
+
+    def stop_vms(self, targets, method=UTMVirtualMachineStopMethod.request):
+        return self.run('stop', targets, method)
+
+    def snapshot(self, targets, name=None):
+        return self.run('snapshot', targets, name)
+
+    def close(self):
+        for process, conn, thread in self._shards:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        for process, conn, thread in self._shards:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._shards = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,12 +1,12 @@
 import asyncio
 import json
-import os
+import tempfile
 import urllib.parse
 import warnings
-from pathlib import Path
 from .asyncglib import AsyncLoop
 from .data import GByteArray
 from .gencert import generate_certificate_async
+from .paths import get_user_config_path
 from .zeroconf import get_dbus, ServiceBrowser
 from .utmremoteclient import UTMRemoteClient
 from .utmremotemessage import (UTMVirtualMachineState,
@@ -17,16 +17,22 @@ from gi.repository import GLib, Gio, GObject, Gtk, Gdk  # noqa: E402
 try:
     gi.require_version('SpiceClientGtk', '3.0')
 except ValueError:
+    _prefetch_spice_certificates = True
+
     async def _run_remote_viewer(vm, client, host, port, password, pubkey):
-        ca_file = get_user_runtime_path(f"{vm}.crt")
+        ca_file = await client.spice_certificates.get_path(
+            (host, port), pubkey)
+        if ca_file is None or not ca_file.exists():
+            with tempfile.NamedTemporaryFile("w", suffix=".crt",
+                                             delete=False) as f:
+                f.write(await client.spice_certificates.get(
+                    (host, port), pubkey))
+            ca_file = f.name
         spice_url = urllib.parse.urlunparse((
             'spice', '['+host+']' if ':' in host else host,
             '', '', urllib.parse.urlencode(
                 [('tls-port', port),
                  ('password', password)]), ''))
-        spice_cert = await client.get_spice_cert((host, port), pubkey)
-        with open(ca_file, "w") as f:
-            f.write(spice_cert)
         await asyncio.create_subprocess_exec(
             "remote-viewer",
             "--spice-host-subject=CN=UTM Remote SPICE Server, O=UTM",
@@ -34,6 +40,8 @@ except ValueError:
 else:
     from gi.repository import SpiceClientGtk, SpiceClientGLib
 
+    _prefetch_spice_certificates = False
+
     class SpiceWindow(Gtk.Window):
         def __init__(self, host, port, password, pubkey):
             Gtk.Window.__init__(self)
@@ -95,23 +103,6 @@ else:
             lambda: SpiceWindow(host, port, password, pubkey).show_all())
 
 
-def _get_user_path(environ, fallback, *sub):
-    path = os.environ.get(environ, "")
-    if not path.strip():
-        path = os.path.expanduser(fallback)
-    path = Path(path, "pyutmremote")
-    path.mkdir(mode=0o700, parents=True, exist_ok=True)
-    return path.joinpath(*sub)
-
-
-def get_user_config_path(*sub):
-    return _get_user_path("XDG_CONFIG_HOME", "~/.config", *sub)
-
-
-def get_user_runtime_path(*sub):
-    return _get_user_path("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}", *sub)
-
-
 class SignalingUTMRemoteClient(UTMRemoteClient, GObject.GObject):
     __gsignals__ = {
         'list_has_changed':
@@ -311,8 +302,8 @@ class VirtualMachineList(Gtk.TreeView):
             id, name, state = list_store.get(treeiter, 0, 1, 3)
             return id, name, UTMVirtualMachineState[state]
 
-    def update_list(self, vm_ids=None):
-        self.bar.run_async_task(self.loop, self._list_vms(vm_ids),
+    def update_list(self):
+        self.bar.run_async_task(self.loop, self._list_vms(),
                                 f"Listing virtual machines")
 
     def vm_did_transition(self, id, state, isTakeoverAllowed):
@@ -326,18 +317,14 @@ class VirtualMachineList(Gtk.TreeView):
             self.vms[vminfo.id] = self.model.append([
                 vminfo.id, vminfo.name, vminfo.backend, vminfo.state.name])
 
-    async def _list_vms(self, vm_ids=None):
-        remote = self.client.remote
-        if vm_ids is None:
-            vm_ids = await remote.listVirtualMachines()
+    async def _list_vms(self):
         await AsyncLoop.wrap(self._update_vminfos,
-                             await remote.getVirtualMachineInformation(vm_ids))
+                             await self.client.inventory.get())
 
 
 class ServerWindow(Gtk.Window):
     def __init__(self, loop, client, info):
         super().__init__(title=info.get('name') or info.get('address'))
-        self.server_address = info['address']
         self.connect('delete-event', lambda win, event: client.close())
         client.signal_connect('list_has_changed', self._list_has_changed)
         client.signal_connect('qemu_configuration_has_changed',
@@ -399,10 +386,9 @@ class ServerWindow(Gtk.Window):
                 lambda info: self._start_complete(info, vm))
 
     def _start_complete(self, info, vm):
-        host, port = info.spiceHostExternal, info.spicePortExternal
-        if not port:
-            host, port = self.server_address, info.spicePortInternal
-        if host and port:
+        server = self.client.spice_server(info)
+        if server is not None and server[0]:
+            host, port = server
             self.bar.run_async_task(
                 self.loop, _run_remote_viewer(
                     vm, self.client, host, port,
@@ -439,7 +425,7 @@ class ServerWindow(Gtk.Window):
                 f"Resuming {name}...")
 
     def _list_has_changed(self, client, ids):
-        self.vmlist.update_list(ids)
+        self.vmlist.update_list()
         self._selection_changed(self.vmlist.get_selection())
 
     def _qemu_configuration_has_changed(self, client, id, configuration):
@@ -637,7 +623,9 @@ class ServerList(Gtk.ListBox):
         ServerWindow(self.loop, client, info).show_all()
 
     async def _open_async(self, info):
-        client = SignalingUTMRemoteClient(self.cert_path)
+        client = SignalingUTMRemoteClient(
+            self.cert_path,
+            prefetch_spice_certificates=_prefetch_spice_certificates)
         password = info.get('password')
 
         async def fingerprint_check(fp):
@@ -653,7 +641,11 @@ class ServerList(Gtk.ListBox):
             password = pw if save else None
             return pw
 
-        await client.connect((info['address'], info['port']),
+        addresses = [info['address']] + [
+            address for address in self.browser.get_addresses(
+                info.get('name'), info['port'])
+            if address != info['address']]
+        await client.connect((addresses, info['port']),
                              password=password,
                              expected_fingerprint=fingerprint_check,
                              password_query=password_query)
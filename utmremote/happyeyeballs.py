@@ -0,0 +1,129 @@
+import asyncio
+import collections
+import itertools
+import socket
+
+
+class AddressCache:
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.addresses = collections.OrderedDict()
+
+    def get(self, key):
+        address = self.addresses.get(key)
+        if address is not None:
+            self.addresses.move_to_end(key)
+        return address
+
+    def put(self, key, address):
+        self.addresses[key] = address
+        self.addresses.move_to_end(key)
+        while len(self.addresses) > self.max_entries:
+            self.addresses.popitem(last=False)
+
+    def discard(self, key):
+        self.addresses.pop(key, None)
+
+
+last_good = AddressCache()
+
+
+def _key(hosts, port):
+    if isinstance(hosts, str):
+        hosts = [hosts]
+    return tuple(hosts), port
+
+
+def remember(transport, hosts, port, cache=last_good):
+    cache.put(_key(hosts, port), transport.get_extra_info('peername'))
+
+
+def forget(hosts, port, cache=last_good):
+    cache.discard(_key(hosts, port))
+
+
+def _interleave(infos):
+    families = collections.OrderedDict()
+    for info in infos:
+        families.setdefault(info[0], []).append(info)
+    return [info for infos in itertools.zip_longest(*families.values())
+            for info in infos if info is not None]
+
+
+async def resolve(hosts, port):
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*(
+        loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        for host in hosts), return_exceptions=True)
+    infos = []
+    seen = set()
+    errors = []
+    for host, result in zip(hosts, results):
+        if isinstance(result, Exception):
+            errors.append(result)
+            continue
+        for family, type, proto, _, address in result:
+            if address not in seen:
+                seen.add(address)
+                infos.append((family, type, proto, address, host))
+    if not infos:
+        raise errors[0] if errors else OSError(
+            f"No addresses found for {', '.join(hosts)}")
+    return _interleave(infos)
+
+
+async def _attempt(protocol_factory, info, ssl, transport_options):
+    loop = asyncio.get_running_loop()
+    family, type, proto, address, host = info
+    sock = socket.socket(family, type, proto)
+    try:
+        sock.setblocking(False)
+        if transport_options is not None:
+            transport_options.configure_socket(sock)
+        await loop.sock_connect(sock, address)
+        return await loop.create_connection(
+            protocol_factory, sock=sock, ssl=ssl,
+            server_hostname=host if ssl is not None else None)
+    except BaseException:
+        sock.close()
+        raise
+
+
+def _close_loser(task):
+    if not task.cancelled() and task.exception() is None:
+        task.result()[0].close()
+
+
+async def connect(protocol_factory, hosts, port, ssl=None, delay=0.25,
+                  transport_options=None, cache=last_good):
+    key = _key(hosts, port)
+    infos = await resolve(key[0], port)
+    cached = cache.get(key) if cache is not None else None
+    infos.sort(key=lambda info: info[3] != cached)
+    infos = iter(infos)
+    attempts = {}
+    errors = []
+    try:
+        info = next(infos, None)
+        while info is not None or attempts:
+            if info is not None:
+                attempts[asyncio.ensure_future(_attempt(
+                    protocol_factory, info, ssl, transport_options))] = info
+            done, _ = await asyncio.wait(
+                attempts, timeout=delay if info is not None else None,
+                return_when=asyncio.FIRST_COMPLETED)
+            info = next(infos, None)
+            for task in done:
+                del attempts[task]
+                if task.exception() is not None:
+                    errors.append(task.exception())
+                    continue
+                return task.result()
+        if len(errors) == 1:
+            raise errors[0]
+        raise OSError(f"Multiple exceptions: {', '.join(map(str, errors))}")
+    finally:
+        for task in attempts:
+            task.cancel()
+            task.add_done_callback(_close_loser)
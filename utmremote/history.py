@@ -0,0 +1,213 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+
+from .utmremotemessage import UTMRemoteMessageClient as CM
+from .utmremotemessage import UTMVirtualMachineState
+
+TRANSITION = 0
+ERROR = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    time REAL NOT NULL,
+    host TEXT NOT NULL,
+    vm TEXT NOT NULL,
+    kind INTEGER NOT NULL,
+    state INTEGER,
+    takeover INTEGER,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS events_vm_time ON events (vm, time);
+CREATE INDEX IF NOT EXISTS events_time ON events (time);
+"""
+
+
+class EventHistory:
+
+    def __init__(self, path, batch_size=512, flush_interval=1.0,
+                 synchronous="NORMAL", retention=None,
+                 compact_interval=3600.0):
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Invalid synchronous mode '{synchronous}'")
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.synchronous = synchronous.upper()
+        self.retention = retention
+        self.compact_interval = compact_interval
+        self.written = 0
+        self.commits = 0
+        self._streams = set()
+        self._queue = queue.SimpleQueue()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+        db.close()
+        self._thread = threading.Thread(
+            target=self._write, name="utmremote-history", daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute(f"PRAGMA synchronous={self.synchronous}")
+        return db
+
+    def record_transition(self, id, state, isTakeoverAllowed, host="",
+                          timestamp=None):
+        self._queue.put((timestamp or time.time(), host, str(id),
+                         TRANSITION, int(state), int(isTakeoverAllowed),
+                         None))
+
+    def record_error(self, id, errorMessage, host="", timestamp=None):
+        self._queue.put((timestamp or time.time(), host, str(id), ERROR,
+                         None, None, errorMessage))
+
+    def record(self, event, host="", timestamp=None):
+        timestamp = timestamp or getattr(event, 'received', None)
+        if isinstance(event, CM.VirtualMachineDidTransition.Request):
+            self.record_transition(event.id, event.state,
+                                   event.isTakeoverAllowed, host, timestamp)
+        elif isinstance(event, CM.VirtualMachineDidError.Request):
+            self.record_error(event.id, event.errorMessage, host, timestamp)
+
+    @property
+    def dropped(self):
+        return sum(stream.dropped for stream in self._streams)
+
+    def attach(self, client, host="", max_size=None):
+        stream = client.events(max_size, "drop_newest")
+        self._streams.add(stream)
+
+        async def consume():
+            async for event in stream:
+                self.record(event, host)
+        task = asyncio.ensure_future(consume())
+        task.add_done_callback(lambda _: stream.close())
+        return task
+
+    def _write(self):
+        db = self._connect()
+        last_compact = None
+        running = True
+        while running:
+            rows = []
+            waiters = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(rows) < self.batch_size:
+                try:
+                    item = self._queue.get(
+                        timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                if isinstance(item, tuple):
+                    rows.append(item)
+                else:
+                    waiters.append(item)
+                    break
+            if rows:
+                with db:
+                    db.executemany(
+                        "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows)
+                self.written += len(rows)
+                self.commits += 1
+            for waiter in waiters:
+                if callable(waiter):
+                    waiter(db)
+                else:
+                    waiter.set()
+            if self.retention is not None and (
+                    last_compact is None or
+                    time.monotonic() - last_compact > self.compact_interval):
+                self._compact(db, time.time() - self.retention)
+                last_compact = time.monotonic()
+        db.close()
+
+    def _compact(self, db, before):
+        with db:
+            cursor = db.execute("""
+                DELETE FROM events WHERE time < :before AND rowid NOT IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, MAX(time) FROM events
+                        WHERE kind = 0 AND time < :before GROUP BY vm))
+                """, dict(before=before))
+        return cursor.rowcount
+
+    def flush(self, timeout=None):
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def compact(self, before=None, timeout=None):
+        if before is None:
+            if self.retention is None:
+                raise ValueError("No retention configured")
+            before = time.time() - self.retention
+        done = threading.Event()
+        result = []
+
+        def compact(db):
+            result.append(self._compact(db, before))
+            done.set()
+        self._queue.put(compact)
+        done.wait(timeout)
+        return result[0] if result else None
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _query(self, sql, parameters):
+        db = sqlite3.connect(self.path)
+        try:
+            return db.execute(sql, parameters).fetchall()
+        finally:
+            db.close()
+
+    def events(self, id=None, start=None, end=None, kind=None, host=None):
+        parameters = dict(vm=id and str(id), start=start, end=end, kind=kind,
+                          host=host)
+        where = [condition for condition, name in (
+            ("vm = :vm", "vm"), ("time >= :start", "start"),
+            ("time < :end", "end"), ("kind = :kind", "kind"),
+            ("host = :host", "host")) if parameters[name] is not None]
+        sql = "SELECT time, host, vm, kind, state, takeover, message " \
+            "FROM events"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return self._query(sql + " ORDER BY time", parameters)
+
+    def state_durations(self, id, start, end=None):
+        if end is None:
+            end = time.time()
+        parameters = dict(vm=str(id), start=start, end=end)
+        initial = self._query(
+            "SELECT time, state FROM events WHERE vm = :vm AND kind = 0 "
+            "AND time < :start ORDER BY time DESC LIMIT 1", parameters)
+        transitions = self._query(
+            "SELECT time, state FROM events WHERE vm = :vm AND kind = 0 "
+            "AND time >= :start AND time < :end ORDER BY time", parameters)
+        durations = {}
+        current = None
+        since = start
+        if initial:
+            current = initial[0][1]
+        for timestamp, state in transitions + [(end, None)]:
+            if current is not None:
+                key = UTMVirtualMachineState(current)
+                durations[key] = durations.get(key, 0.0) + timestamp - since
+            current, since = state, timestamp
+        return durations
@@ -0,0 +1,190 @@
+import asyncio
+import collections
+import copy
+
+
+class VirtualMachineInventory:
+
+    def __init__(self, client):
+        self.client = client
+        self.vminfos = None
+        self.version = 0
+        self.fetches = 0
+        self._subscribers = []
+        self._pending = set()
+        self._overrides = {}
+        self._loading = None
+
+    @property
+    def loaded(self):
+        return self.vminfos is not None
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def _changed(self, ids):
+        self.version += 1
+        for callback in list(self._subscribers):
+            callback(self, ids)
+
+    async def _fetch(self, ids):
+        self.fetches += 1
+        for id in ids:
+            self._overrides.setdefault(id, {})
+        try:
+            infos = await self.client.remote.getVirtualMachineInformation(
+                ids)
+        finally:
+            overrides = {id: self._overrides.pop(id, {}) for id in ids}
+        changed = []
+        for info in infos:
+            info = copy.copy(info)
+            for key, value in overrides.get(info.id, {}).items():
+                setattr(info, key, value)
+            if self.vminfos is not None and info.id in self.vminfos:
+                self.vminfos[info.id] = info
+                changed.append(info.id)
+        if changed:
+            self._changed(changed)
+
+    def _fetch_later(self, ids):
+        task = asyncio.create_task(self._fetch(ids))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _settle(self):
+        while self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        missing = [id for id, info in self.vminfos.items() if info is None]
+        if missing:
+            await self._fetch(missing)
+
+    async def _load(self):
+        ids = await self.client.remote.listVirtualMachines()
+        self.vminfos = dict.fromkeys(ids)
+        try:
+            await self._settle()
+        except BaseException:
+            self.vminfos = None
+            raise
+        self._changed(list(ids))
+
+    async def refresh(self):
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+            self._loading.add_done_callback(
+                lambda _: setattr(self, '_loading', None))
+        await asyncio.shield(self._loading)
+
+    async def get(self):
+        if self.vminfos is None:
+            await self.refresh()
+        else:
+            await self._settle()
+        return [info for info in self.vminfos.values() if info is not None]
+
+    async def get_info(self, id):
+        for info in await self.get():
+            if info.id == id:
+                return info
+        raise KeyError(id)
+
+    async def resync(self):
+        if self.vminfos is None:
+            return False
+        ids = await self.client.remote.listVirtualMachines()
+        changed = ids != list(self.vminfos)
+        if changed:
+            self.listHasChanged(ids)
+        known = [id for id, info in self.vminfos.items() if info is not None]
+        if known:
+            await self._fetch(known)
+        await self._settle()
+        return changed
+
+    def listHasChanged(self, ids):
+        if self.vminfos is None:
+            return
+        added = [id for id in ids if id not in self.vminfos]
+        removed = [id for id in self.vminfos if id not in ids]
+        self.vminfos = {id: self.vminfos.get(id) for id in ids}
+        if added:
+            self._fetch_later(added)
+        self._changed(added + removed)
+
+    def _update(self, id, **values):
+        if self.vminfos is None or id not in self.vminfos:
+            return
+        info = self.vminfos[id]
+        if info is None or id in self._overrides:
+            self._overrides.setdefault(id, {}).update(values)
+        if info is not None:
+            info = copy.copy(info)
+            for key, value in values.items():
+                setattr(info, key, value)
+            self.vminfos[id] = info
+            self._changed([id])
+
+    def mountedDrivesHasChanged(self, id, mountedDrives):
+        self._update(id, mountedDrives=mountedDrives)
+
+    def virtualMachineDidTransition(self, id, state, isTakeoverAllowed):
+        self._update(id, state=state, isTakeoverAllowed=isTakeoverAllowed)
+
+
+class QEMUConfigurationCache:
+
+    def __init__(self, client, max_entries=128):
+        self.client = client
+        self.max_entries = max_entries
+        self.configurations = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._generation = collections.Counter()
+
+    def __contains__(self, id):
+        return id in self.configurations
+
+    def __len__(self):
+        return len(self.configurations)
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    entries=len(self.configurations))
+
+    def _store(self, id, configuration):
+        self.configurations[id] = configuration
+        self.configurations.move_to_end(id)
+        while len(self.configurations) > self.max_entries:
+            self.configurations.popitem(last=False)
+
+    async def get(self, id):
+        configuration = self.configurations.get(id)
+        if configuration is not None:
+            self.hits += 1
+            self.configurations.move_to_end(id)
+            return configuration
+        self.misses += 1
+        generation = self._generation[id]
+        configuration = await self.client.remote.getQEMUConfiguration(id)
+        if generation == self._generation[id]:
+            self._store(id, configuration)
+        return self.configurations.get(id, configuration)
+
+    def invalidate(self, id=None):
+        if id is None:
+            self._generation.update(self.configurations.keys())
+            self.configurations.clear()
+        else:
+            self._generation[id] += 1
+            self.configurations.pop(id, None)
+
+    def listHasChanged(self, ids):
+        ids = set(ids)
+        for id in [id for id in self.configurations if id not in ids]:
+            self.invalidate(id)
+
+    def qemuConfigurationHasChanged(self, id, configuration):
+        self._generation[id] += 1
+        self._store(id, configuration)
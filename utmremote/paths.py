@@ -0,0 +1,19 @@
+import os
+from pathlib import Path
+
+
+def _get_user_path(environ, fallback, *sub):
+    path = os.environ.get(environ, "")
+    if not path.strip():
+        path = os.path.expanduser(fallback)
+    path = Path(path, "pyutmremote")
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path.joinpath(*sub)
+
+
+def get_user_config_path(*sub):
+    return _get_user_path("XDG_CONFIG_HOME", "~/.config", *sub)
+
+
+def get_user_runtime_path(*sub):
+    return _get_user_path("XDG_RUNTIME_DIR", f"/run/user/{os.getuid()}", *sub)
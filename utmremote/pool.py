@@ -0,0 +1,155 @@
+import asyncio
+
+from .bulk import BulkOperation
+from .utmremoteclient import ClientIdentity, UTMRemoteClient
+
+
+class PoolHost:
+
+    def __init__(self, name, server, password=None, fingerprint=None):
+        self.name = name
+        self.server = server
+        self.password = password
+        self.fingerprint = fingerprint
+        self.client = None
+        self.lock = asyncio.Lock()
+        self.latency = None
+        self.connect_time = None
+        self.last_used = None
+        self.connects = 0
+        self.failures = 0
+        self.last_error = None
+
+    @property
+    def is_connected(self):
+        return self.client is not None and \
+            self.client.transport is not None and \
+            not self.client.transport.is_closing()
+
+    def record_latency(self, rtt, weight=0.2):
+        if self.latency is None:
+            self.latency = rtt
+        else:
+            self.latency += weight * (rtt - self.latency)
+
+    def close(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+
+class UTMRemotePool:
+
+    def __init__(self, certificate, connect_concurrency=16, idle_timeout=None,
+                 client_class=UTMRemoteClient, **client_kwargs):
+        if not isinstance(certificate, ClientIdentity):
+            certificate = ClientIdentity.load(certificate)
+        self.identity = certificate
+        self.connect_concurrency = connect_concurrency
+        self.idle_timeout = idle_timeout
+        self.client_class = client_class
+        self.client_kwargs = client_kwargs
+        self.hosts = {}
+        self._reaper = None
+
+    def add_host(self, name, server, password=None, fingerprint=None):
+        if name in self.hosts:
+            raise ValueError(f"Host '{name}' already in pool")
+        self.hosts[name] = PoolHost(name, server, password, fingerprint)
+        return self.hosts[name]
+
+    def remove_host(self, name):
+        self.hosts.pop(name).close()
+
+    async def _connect(self, host):
+        loop = asyncio.get_running_loop()
+        host.close()
+        client = self.client_class(self.identity, **self.client_kwargs)
+        start = loop.time()
+        try:
+            await client.connect(host.server, host.password,
+                                 host.fingerprint or (lambda fp: None))
+        except Exception as error:
+            host.failures += 1
+            host.last_error = error
+            raise
+        host.connect_time = loop.time() - start
+        if host.fingerprint is None:
+            host.fingerprint = client.connection_fingerprint
+        host.client = client
+        host.connects += 1
+        host.last_used = loop.time()
+        host.last_error = None
+        return client
+
+    async def get(self, name):
+        host = self.hosts[name]
+        if not host.is_connected:
+            async with host.lock:
+                if not host.is_connected:
+                    await self._connect(host)
+        host.last_used = asyncio.get_running_loop().time()
+        return host.client
+
+    async def call(self, name, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        client = await self.get(name)
+        start = loop.time()
+        result = await getattr(client.remote, method)(*args, **kwargs)
+        self.hosts[name].record_latency(loop.time() - start)
+        return result
+
+    async def ping(self, name):
+        await self.call(name, 'listVirtualMachines')
+        return self.hosts[name].latency
+
+    async def start(self):
+        if self.idle_timeout and self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap())
+        return {name: result.exception for name, result in
+                (await self.fan_out(lambda client: None)).items()
+                if not result.ok}
+
+    async def _reap(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            for host in self.hosts.values():
+                if host.client is not None and not host.lock.locked() and \
+                   loop.time() - host.last_used > self.idle_timeout:
+                    host.close()
+
+    def fan_out(self, func, names=None, concurrency=None, timeout=None):
+        async def run(name):
+            client = await self.get(name)
+            result = func(client)
+            return await result if asyncio.iscoroutine(result) else result
+
+        return BulkOperation(
+            run, self.hosts if names is None else names,
+            concurrency=concurrency or self.connect_concurrency,
+            timeout=timeout)
+
+    def list_all(self, names=None, concurrency=None, timeout=None):
+        return self.fan_out(lambda client: client.inventory.get(),
+                            names, concurrency, timeout)
+
+    def stats(self):
+        return {name: dict(connected=host.is_connected,
+                           latency=host.latency,
+                           connect_time=host.connect_time,
+                           connects=host.connects, failures=host.failures)
+                for name, host in self.hosts.items()}
+
+    def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        for host in self.hosts.values():
+            host.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
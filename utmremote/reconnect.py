@@ -0,0 +1,139 @@
+import asyncio
+import inspect
+import random
+
+from .utmremoteclient import UTMRemoteClient
+
+
+class ReconnectingUTMRemoteClient(UTMRemoteClient):
+
+    class RemotePeer:
+
+        def __init__(self, remoteClient):
+            self.remoteClient = remoteClient
+
+        async def _peer(self):
+            return self.remoteClient.peer or \
+                await self.remoteClient.wait_connected()
+
+        async def encode(self, value):
+            return await (await self._peer()).encode(value)
+
+        async def decode(self, cls, data):
+            return await (await self._peer()).decode(cls, data)
+
+        async def sendWithReply(self, id, data):
+            peer = await self.remoteClient.wait_connected()
+            return await peer.sendWithReply(id, data)
+
+    def __init__(self, *args, backoff_initial=0.5, backoff_max=30.0,
+                 backoff_factor=2.0, backoff_jitter=0.5, max_attempts=None,
+                 queue_requests=True, queue_timeout=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.backoff_factor = backoff_factor
+        self.backoff_jitter = backoff_jitter
+        self.max_attempts = max_attempts
+        self.queue_requests = queue_requests
+        self.queue_timeout = queue_timeout
+        self.reconnects = 0
+        self._server = None
+        self._password = None
+        self._closed = False
+        self._connected = asyncio.Event()
+        self._reconnect_task = None
+        self._stable_remote = self.Remote(self.RemotePeer(self),
+                                          self._server_information)
+
+    @property
+    def is_connected(self):
+        return self._connected.is_set()
+
+    async def wait_connected(self):
+        if self._closed:
+            raise ConnectionError("Client closed")
+        if not self._connected.is_set():
+            if not self.queue_requests:
+                raise ConnectionError("Not connected")
+            try:
+                await asyncio.wait_for(self._connected.wait(),
+                                       self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise ConnectionError("Not connected") from None
+            if self._closed:
+                raise ConnectionError("Client closed")
+        return self.peer
+
+    async def connect(self, server, password=None, expected_fingerprint=None,
+                      password_query=None):
+        self._closed = False
+        self._server = server
+        self._password = password
+
+        async def query():
+            self._password = password_query()
+            if inspect.isawaitable(self._password):
+                self._password = await self._password
+            return self._password
+
+        await super().connect(server, password, expected_fingerprint,
+                              query if password_query is not None else None)
+        self._connected_remote()
+
+    def _connected_remote(self):
+        self._stable_remote.capabilities = self.remote.capabilities
+        self._stable_remote.model = self.remote.model
+        self.remote = self._stable_remote
+        self._connected.set()
+
+    def connection_lost(self, error):
+        super().connection_lost(error)
+        was_connected = self._connected.is_set()
+        self._connected.clear()
+        if was_connected and not self._closed and \
+           self._reconnect_task is None:
+            self._reconnect_task = asyncio.create_task(self._reconnect())
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_max,
+                    self.backoff_initial * self.backoff_factor ** attempt)
+        return delay * (1 - self.backoff_jitter * random.random())
+
+    async def _reconnect(self):
+        attempt = 0
+        try:
+            while not self._closed:
+                await asyncio.sleep(self._backoff(attempt))
+                attempt += 1
+                try:
+                    await super().connect(self._server, self._password,
+                                          self.connection_fingerprint)
+                    self._connected_remote()
+                    self.reconnects += 1
+                    await self.resync()
+                    return
+                except Exception as error:
+                    if self.debug:
+                        print(f"reconnect attempt {attempt} failed: "
+                              f"{error!r}")
+                    if self.max_attempts is not None and \
+                       attempt >= self.max_attempts:
+                        self._closed = True
+                        self._connected.set()
+                        return
+        finally:
+            self._reconnect_task = None
+
+    def close(self):
+        self._closed = True
+        self._connected.set()
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        super().close()
+
+    async def resync(self):
+        self.configurations.invalidate()
+        if await self.inventory.resync():
+            await self.remoteListHasChanged(list(self.inventory.vminfos))
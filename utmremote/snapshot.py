@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+from .bulk import BulkOperation
+from .utmremotemessage import UTMVirtualMachineState
+
+
+class SnapshotResult:
+
+    def __init__(self, id):
+        self.id = id
+        self.exception = None
+        self.initial_state = None
+        self.timings = {}
+        self.saved = False
+        self.rolled_back = False
+
+    @property
+    def ok(self):
+        return self.exception is None
+
+    @property
+    def elapsed(self):
+        return sum(self.timings.values())
+
+    def __repr__(self):
+        if self.exception is not None:
+            return f"SnapshotResult({self.id!r}, exception={self.exception!r})"
+        return f"SnapshotResult({self.id!r}, timings={self.timings!r})"
+
+
+class SnapshotReport:
+
+    def __init__(self, name, results, elapsed):
+        self.name = name
+        self.results = results
+        self.elapsed = elapsed
+
+    @property
+    def failures(self):
+        return {id: result.exception for id, result in self.results.items()
+                if not result.ok}
+
+    @property
+    def serial_elapsed(self):
+        return sum(result.elapsed for result in self.results.values())
+
+    def raise_for_failures(self):
+        failures = self.failures
+        if failures:
+            raise ExceptionGroup(
+                f"Snapshot '{self.name}' failed for {len(failures)} of "
+                f"{len(self.results)} virtual machines",
+                list(failures.values()))
+
+
+class SnapshotOrchestrator:
+
+    def __init__(self, client, concurrency=8, timeout=120.0, atomic=False):
+        self.client = client
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.atomic = atomic
+
+    async def _step(self, result, step, coro):
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            result.timings[step] = time.perf_counter() - start
+
+    async def _transition(self, id, request, state):
+        await request
+        await self.client.wait_for_state(id, state, self.timeout)
+
+    async def _snapshot_one(self, id, name):
+        remote = self.client.remote
+        result = SnapshotResult(id)
+        paused = False
+        try:
+            info = await self._step(result, 'info', remote.getInfo(id))
+            result.initial_state = info.state
+            if info.state == UTMVirtualMachineState.started:
+                await self._step(result, 'pause', self._transition(
+                    id, remote.pauseVirtualMachine(id),
+                    UTMVirtualMachineState.paused))
+                paused = True
+            await self._step(result, 'save',
+                             remote.saveSnapshotVirtualMachine(id, name))
+            result.saved = True
+            if paused:
+                await self._step(result, 'resume', self._transition(
+                    id, remote.resumeVirtualMachine(id),
+                    UTMVirtualMachineState.started))
+                paused = False
+        except Exception as exc:
+            result.exception = exc
+            if paused:
+                await self._rollback(result, self._transition(
+                    id, remote.resumeVirtualMachine(id),
+                    UTMVirtualMachineState.started))
+        return result
+
+    async def _rollback(self, result, coro):
+        try:
+            await self._step(result, 'rollback', coro)
+        except Exception as exc:
+            exc.add_note(f"rollback of {result.id} failed")
+            result.exception = ExceptionGroup(
+                f"Snapshot of {result.id} failed",
+                [result.exception, exc])
+        else:
+            result.rolled_back = True
+
+    async def snapshot(self, ids, name=None):
+        start = time.perf_counter()
+        operation = BulkOperation(self._snapshot_one, ids, (name,),
+                                  self.concurrency)
+        results = {id: result.get() for id, result in (
+            await operation).items()}
+        if self.atomic and any(not result.ok for result in results.values()):
+            saved = [result for result in results.values() if result.saved]
+            for result in saved:
+                if result.ok:
+                    result.exception = RuntimeError(
+                        "Snapshot rolled back after other failures")
+            await asyncio.gather(*(
+                self._rollback(result,
+                               self.client.remote.deleteSnapshotVirtualMachine(
+                                   result.id, name))
+                for result in saved))
+        return SnapshotReport(name, results, time.perf_counter() - start)
@@ -0,0 +1,105 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+
+from .paths import get_user_runtime_path
+
+
+def _retrieve(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class SpiceCertificateCache:
+
+    def __init__(self, fetch, directory=None):
+        self.fetch = fetch
+        self._directory = directory
+        self.certificates = {}
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+
+    @staticmethod
+    def key(server, pubkey):
+        host, port = server
+        return (str(host), int(port), bytes(pubkey or b''))
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            try:
+                self._directory = get_user_runtime_path("spice")
+                self._directory.mkdir(mode=0o700, exist_ok=True)
+            except OSError:
+                self._directory = False
+        return self._directory or None
+
+    def _path(self, key):
+        if self.directory is None:
+            return None
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return self.directory / f"{digest[:32]}.crt"
+
+    def _lookup(self, key):
+        certificate = self.certificates.get(key)
+        if certificate is None:
+            path = self._path(key)
+            try:
+                certificate = path.read_text() if path else None
+            except OSError:
+                certificate = None
+            if certificate:
+                self.certificates[key] = certificate
+        return certificate
+
+    def _store(self, key, certificate):
+        self.certificates[key] = certificate
+        path = self._path(key)
+        if path is None:
+            return
+        try:
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(certificate)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    async def _fetch(self, server, key):
+        certificate = await self.fetch(server, key[2] or None)
+        self._store(key, certificate)
+        return certificate
+
+    def _start(self, server, key):
+        future = self._pending.get(key)
+        if future is None:
+            self.misses += 1
+            future = self._pending[key] = asyncio.ensure_future(
+                self._fetch(server, key))
+            future.add_done_callback(_retrieve)
+            future.add_done_callback(
+                lambda _: self._pending.pop(key, None))
+        return future
+
+    def prefetch(self, server, pubkey=None):
+        key = self.key(server, pubkey)
+        if self._lookup(key) is None:
+            self._start(server, key)
+
+    async def get(self, server, pubkey=None):
+        key = self.key(server, pubkey)
+        certificate = self._lookup(key)
+        if certificate is not None:
+            self.hits += 1
+            return certificate
+        return await asyncio.shield(self._start(server, key))
+
+    async def get_path(self, server, pubkey=None):
+        await self.get(server, pubkey)
+        return self._path(self.key(server, pubkey))
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    entries=len(self.certificates))
@@ -0,0 +1,81 @@
+import collections
+import contextlib
+import contextvars
+import ssl
+import time
+
+_pending_session = contextvars.ContextVar('_pending_session', default=None)
+
+
+class _ResumingSSLObject(ssl.SSLObject):
+
+    @classmethod
+    def _create(cls, incoming, outgoing, server_side=False,
+                server_hostname=None, session=None, context=None):
+        if session is None and not server_side:
+            session = _pending_session.get()
+        return super()._create(incoming, outgoing, server_side=server_side,
+                               server_hostname=server_hostname,
+                               session=session, context=context)
+
+
+class SSLSessionCache:
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def enable(ssl_context):
+        ssl_context.sslobject_class = _ResumingSSLObject
+
+    def get(self, server, ssl_context):
+        entry = self.entries.get(server)
+        if entry is None:
+            return None
+        context, session, peercert = entry
+        if context is not ssl_context or \
+           session.time + session.timeout < time.time():
+            del self.entries[server]
+            return None
+        self.entries.move_to_end(server)
+        return session, peercert
+
+    def put(self, server, ssl_context, sslobj, peercert):
+        session = sslobj.session
+        if session is None:
+            return
+        self.entries[server] = (ssl_context, session, peercert)
+        self.entries.move_to_end(server)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def discard(self, server):
+        self.entries.pop(server, None)
+
+    def record(self, sslobj):
+        if sslobj.session_reused:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return sslobj.session_reused
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses,
+                    hit_rate=self.hit_rate, entries=len(self.entries))
+
+    @contextlib.contextmanager
+    def resuming(self, server, ssl_context):
+        entry = self.get(server, ssl_context)
+        token = _pending_session.set(None if entry is None else entry[0])
+        try:
+            yield None if entry is None else entry[1]
+        finally:
+            _pending_session.reset(token)
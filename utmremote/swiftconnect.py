@@ -1,6 +1,9 @@
 import asyncio
+import concurrent.futures
 import enum
+import mmap
 import struct
+import tempfile
 
 from .data import Data
 
@@ -16,11 +19,16 @@ def messageId(id):
     return decorator
 
 
+def _payload_size(value):
+    return sum(len(v) for v in vars(value).values()
+               if isinstance(v, (bytes, bytearray, memoryview)))
+
+
 class Message:
     @classmethod
     async def send(cls, parameters, to_peer):
-        return cls.Reply(await to_peer.sendWithReply(
-            cls.id, parameters.encode()))
+        return await to_peer.decode(cls.Reply, await to_peer.sendWithReply(
+            cls.id, await to_peer.encode(parameters)))
 
 
 class LocalInterface:
@@ -31,6 +39,9 @@ class LocalInterface:
     async def handle_error(error):
         raise error
 
+    def connectionLost(self, error):
+        pass
+
 
 class PeerFlag(int, enum.Flag):
     none = 0
@@ -39,6 +50,9 @@ class PeerFlag(int, enum.Flag):
 
 
 class Peer:
+    offload_threshold = None
+    executor = None
+
     def __init__(self, local, debug=False):
         self.debug = debug
         self.local = local
@@ -46,6 +60,27 @@ class Peer:
         self.token = 1
         self.futures = {}
         self.is_trusted = False
+        self.offloaded = 0
+
+    def _offload(self, func, *args):
+        self.offloaded += 1
+        return asyncio.get_running_loop().run_in_executor(
+            self.executor, func, *args)
+
+    async def encode(self, value):
+        if self.offload_threshold is not None and \
+           _payload_size(value) >= self.offload_threshold:
+            return await self._offload(value.encode)
+        return value.encode()
+
+    async def decode(self, cls, data):
+        if self.offload_threshold is not None and \
+           len(data) >= self.offload_threshold:
+            if isinstance(self.executor,
+                          concurrent.futures.ProcessPoolExecutor):
+                data = Data(bytes(data))
+            return await self._offload(cls, data)
+        return cls(data)
 
     def enqueue(self):
         token, future = self.token, asyncio.get_running_loop().create_future()
@@ -57,16 +92,21 @@ class Peer:
         futures = self.futures
         self.futures = {}
         for token, future in futures.items():
-            future.set_exception(error)
+            if not future.done():
+                future.set_exception(error)
+
+    def connectionLost(self, error):
+        self.failAll(error)
+        self.local.connectionLost(error)
 
     def complete(self, data, token):
         future = self.futures.pop(token, None)
-        if future is not None:
+        if future is not None and not future.done():
             future.set_result(data)
 
     def fail(self, error, token):
         future = self.futures.pop(token, None)
-        if future is not None:
+        if future is not None and not future.done():
             future.set_exception(error)
 
     async def serviceReply(self, msg):
@@ -128,57 +168,167 @@ class Peer:
         self.is_trusted = True
 
 
+class SpillFile:
+    max_pending = 16
+
+    def __init__(self, transport, directory=None):
+        self.transport = transport
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix="utmremote-spill")
+        self.pending = 0
+        self.paused = False
+        self.error = None
+
+    def write(self, chunk):
+        self.pending += 1
+        if self.pending >= self.max_pending and not self.paused:
+            self.paused = True
+            self.transport.pause_reading()
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, self.file.write, bytes(chunk))
+        future.add_done_callback(self._written)
+
+    def _written(self, future):
+        self.pending -= 1
+        if not future.cancelled() and future.exception() is not None:
+            self.error = self.error or future.exception()
+        if self.paused and self.pending <= self.max_pending // 2:
+            self.paused = False
+            if not self.transport.is_closing():
+                self.transport.resume_reading()
+
+    def _map(self, length):
+        try:
+            self.file.flush()
+            return mmap.mmap(self.file.fileno(), length,
+                             access=mmap.ACCESS_READ)
+        finally:
+            self.file.close()
+
+    async def finish(self, length):
+        try:
+            msg = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._map, length)
+        finally:
+            self.executor.shutdown(wait=False)
+        if self.error is not None:
+            raise self.error
+        return msg
+
+    def close(self):
+        self.executor.submit(self.file.close)
+        self.executor.shutdown(wait=False)
+
+
 class SwiftConnectProtocol(asyncio.Protocol):
-    def __init__(self, peer):
+    max_frame_size = 4 << 30
+    max_memory_frame_size = 64 << 20
+    spill_directory = None
+
+    def __init__(self, peer, max_frame_size=None, max_memory_frame_size=None,
+                 spill_directory=None):
         self.valve = asyncio.Event()
         self.transport = None
         self.peer = peer
         peer.protocol = self
+        if max_frame_size is not None:
+            self.max_frame_size = max_frame_size
+        if max_memory_frame_size is not None:
+            self.max_memory_frame_size = max_memory_frame_size
+        if spill_directory is not None:
+            self.spill_directory = spill_directory
 
     def connection_made(self, transport):
         self.transport = transport
-        self.header = None
+        self.header = b''
+        self.msglen = None
         self.data = None
+        self.received = 0
+        self.last_received = self.last_drained = \
+            asyncio.get_running_loop().time()
         self.valve.set()
 
+    def _frame_start(self, msglen):
+        if msglen > self.max_frame_size:
+            error = PeerError(f"Frame length {msglen} exceeds maximum "
+                              f"frame size {self.max_frame_size}")
+            self.peer.failAll(error)
+            self.transport.close()
+            return False
+        self.msglen = msglen
+        self.received = 0
+        if msglen > self.max_memory_frame_size:
+            self.data = SpillFile(self.transport, self.spill_directory)
+        else:
+            self.data = []
+        return True
+
+    def _frame_end(self):
+        if isinstance(self.data, list):
+            asyncio.create_task(self.peer.serviceReply(b''.join(self.data)))
+        else:
+            asyncio.create_task(self._service_spilled(self.data, self.msglen))
+        self.msglen = None
+        self.data = None
+
+    async def _service_spilled(self, data, msglen):
+        try:
+            msg = await data.finish(msglen)
+        except OSError as error:
+            self.peer.failAll(PeerError(f"Cannot spill frame: {error}"))
+            self.transport.close()
+            return
+        await self.peer.serviceReply(msg)
+
     def data_received(self, data):
-        while len(data) > 0:
-            if self.header is None:
-                self.header = data[:8]
-                data = data[8:]
-            elif len(self.header) == 8:
-                msglen, = struct.unpack('>Q', self.header)
-                if self.data is None:
-                    self.data = data[:msglen]
-                    data = data[msglen:]
-                else:
-                    self.data = self.data + data[:msglen-len(self.data)]
-                    data = data[msglen-len(self.data):]
-                if len(self.data) == msglen:
-                    msg = self.data
-                    self.data = None
-                    self.header = None
-                    asyncio.create_task(self.peer.serviceReply(msg))
+        if self.transport.is_closing():
+            return
+        self.last_received = asyncio.get_running_loop().time()
+        data = memoryview(data)
+        while len(data) > 0 or self.msglen == 0:
+            if self.msglen is None:
+                need = 8 - len(self.header)
+                self.header += data[:need]
+                data = data[need:]
+                if len(self.header) == 8:
+                    msglen, = struct.unpack('>Q', self.header)
+                    self.header = b''
+                    if not self._frame_start(msglen):
+                        return
             else:
-                self.header = self.header + data[:8-len(self.header)]
-                data = data[8-len(self.header):]
+                chunk = data[:self.msglen-self.received]
+                data = data[len(chunk):]
+                if isinstance(self.data, list):
+                    self.data.append(bytes(chunk))
+                else:
+                    self.data.write(chunk)
+                self.received += len(chunk)
+            if self.msglen is not None and self.received == self.msglen:
+                self._frame_end()
 
     def connection_lost(self, exc):
-        self.peer.failAll(exc if exc is not None
-                          else PeerError("Connection closed"))
+        if self.data is not None and not isinstance(self.data, list):
+            self.data.close()
+        self.data = None
+        self.peer.connectionLost(exc if exc is not None
+                                 else PeerError("Connection closed"))
         self.valve.set()
 
     def pause_writing(self):
         self.valve.clear()
 
     def resume_writing(self):
+        self.last_drained = asyncio.get_running_loop().time()
         self.valve.set()
 
+    @property
+    def last_progress(self):
+        return max(self.last_received, self.last_drained)
+
     async def send_data(self, *msg):
         msglen = sum(0 if x is None else len(x) for x in msg)
-        data = struct.pack('>Q', msglen)
-        for x in msg:
-            if x is not None:
-                data += bytes(x)
+        data = b''.join([struct.pack('>Q', msglen)] +
+                        [bytes(x) for x in msg if x is not None])
         await self.valve.wait()
         self.transport.write(data)
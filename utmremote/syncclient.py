@@ -0,0 +1,124 @@
+import collections
+import inspect
+import threading
+
+from .eventloop import EventLoopThread
+from .utmremoteclient import ClientIdentity, UTMRemoteClient
+
+_default_loop = None
+_default_loop_lock = threading.Lock()
+
+
+def default_loop():
+    global _default_loop
+    with _default_loop_lock:
+        if _default_loop is None:
+            _default_loop = EventLoopThread(name="utmremote-sync-client")
+        return _default_loop
+
+
+async def _collect(agen):
+    return [item async for item in agen]
+
+
+class SyncRemote:
+
+    def __init__(self, client, blocking=True):
+        self._client = client
+        self._blocking = blocking
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        method = getattr(self._client.client.remote, name)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            return self._client._call(self._blocking, name, args, kwargs)
+        call.__name__ = name
+        return call
+
+
+class SyncUTMRemoteClient:
+
+    _shared = {}
+    _shared_locks = collections.defaultdict(threading.Lock)
+    _shared_lock = threading.Lock()
+
+    def __init__(self, certificate, loop=None, timeout=None,
+                 client_class=UTMRemoteClient, **kwargs):
+        self.loop = loop or default_loop()
+        self.timeout = timeout
+        if not isinstance(certificate, ClientIdentity):
+            certificate = ClientIdentity.load(certificate)
+
+        async def create():
+            return client_class(certificate, **kwargs)
+        self.client = self.loop.run(create())
+        self.remote = SyncRemote(self)
+        self.futures = SyncRemote(self, blocking=False)
+
+    @property
+    def is_connected(self):
+        transport = self.client.transport
+        return transport is not None and not transport.is_closing()
+
+    def submit(self, coro):
+        return self.loop.run_coroutine(coro)
+
+    def run(self, coro, timeout=None):
+        return self.loop.run(coro, timeout or self.timeout)
+
+    def _call(self, blocking, name, args, kwargs):
+        async def call():
+            result = getattr(self.client.remote, name)(*args, **kwargs)
+            if inspect.isasyncgen(result):
+                return await _collect(result)
+            return await result
+        if blocking:
+            return self.run(call())
+        return self.submit(call())
+
+    def connect(self, server, password=None, expected_fingerprint=None,
+                password_query=None):
+        self.run(self.client.connect(server, password, expected_fingerprint,
+                                     password_query))
+
+    def wait_for_state(self, id, states, timeout=None):
+        return self.run(self.client.wait_for_state(id, states, timeout))
+
+    def inventory(self):
+        return self.run(self.client.inventory.get())
+
+    def close(self):
+        if not self.loop.loop.is_closed():
+            self.loop.call(self.client.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @classmethod
+    def shared(cls, certificate, server, password=None,
+               expected_fingerprint=None, **kwargs):
+        host, port = server
+        key = (certificate, host if isinstance(host, str) else tuple(host),
+               port)
+        with cls._shared_lock:
+            lock = cls._shared_locks[key]
+        with lock:
+            client = cls._shared.get(key)
+            if client is None or not client.is_connected:
+                if client is not None:
+                    client.close()
+                client = cls(certificate, **kwargs)
+                try:
+                    client.connect(server, password, expected_fingerprint)
+                except BaseException:
+                    client.close()
+                    raise
+                cls._shared[key] = client
+            return client
@@ -0,0 +1,83 @@
+import socket
+import ssl
+
+
+class TransportOptions:
+
+    def __init__(self, nodelay=None, sndbuf=None, rcvbuf=None,
+                 keepalive=None, keepalive_idle=None,
+                 keepalive_interval=None, keepalive_count=None,
+                 write_buffer_high=None, write_buffer_low=None,
+                 tls13=False, ciphers=None):
+        self.nodelay = nodelay
+        self.sndbuf = sndbuf
+        self.rcvbuf = rcvbuf
+        self.keepalive = keepalive
+        self.keepalive_idle = keepalive_idle
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.write_buffer_high = write_buffer_high
+        self.write_buffer_low = write_buffer_low
+        self.tls13 = tls13
+        self.ciphers = ciphers
+
+    def __repr__(self):
+        attributes = [f"{key}={value!r}" for key, value in vars(self).items()
+                      if value is not None]
+        return f"{self.__class__.__qualname__}({', '.join(attributes)})"
+
+    @property
+    def tls_key(self):
+        return (self.tls13, self.ciphers)
+
+    def configure_ssl_context(self, ssl_context):
+        if self.tls13:
+            ssl_context.minimum_version = ssl.TLSVersion.TLSv1_3
+        if self.ciphers is not None:
+            ssl_context.set_ciphers(self.ciphers)
+
+    def configure_socket(self, sock):
+        if sock is None or sock.family not in (socket.AF_INET,
+                                               socket.AF_INET6):
+            return
+        if self.nodelay is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY,
+                            int(self.nodelay))
+        if self.sndbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+        if self.rcvbuf is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        if self.keepalive is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE,
+                            int(self.keepalive))
+        for option, value in (("TCP_KEEPIDLE", self.keepalive_idle),
+                              ("TCP_KEEPINTVL", self.keepalive_interval),
+                              ("TCP_KEEPCNT", self.keepalive_count)):
+            if value is not None and hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option),
+                                value)
+        if self.keepalive_idle is not None and \
+           not hasattr(socket, "TCP_KEEPIDLE") and \
+           hasattr(socket, "TCP_KEEPALIVE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE,
+                            self.keepalive_idle)
+
+    def configure_transport(self, transport):
+        self.configure_socket(transport.get_extra_info('socket'))
+        if self.write_buffer_high is not None or \
+           self.write_buffer_low is not None:
+            transport.set_write_buffer_limits(self.write_buffer_high,
+                                              self.write_buffer_low)
+
+
+INTERACTIVE = TransportOptions(
+    nodelay=True, keepalive=True, keepalive_idle=10, keepalive_interval=5,
+    keepalive_count=3, write_buffer_high=64 << 10, write_buffer_low=16 << 10,
+    tls13=True)
+
+BULK = TransportOptions(
+    nodelay=False, sndbuf=4 << 20, rcvbuf=4 << 20, keepalive=True,
+    keepalive_idle=60, keepalive_interval=15, keepalive_count=4,
+    write_buffer_high=8 << 20, write_buffer_low=2 << 20)
+
+PROFILES = dict(interactive=INTERACTIVE, bulk=BULK)
@@ -1,9 +1,24 @@
 import asyncio
+import collections
+import contextlib
+import copy
+import functools
 import hashlib
 import inspect
+import os
 import ssl
-
+import time
+
+from .batch import MicroBatcher
+from .bulk import BulkOperation
+from .events import EventStream
+from . import happyeyeballs
+from .inventory import QEMUConfigurationCache, VirtualMachineInventory
+from .spicecert import SpiceCertificateCache
+from .sslsession import SSLSessionCache
 from .swiftconnect import SwiftConnectProtocol, LocalInterface, Peer
+from .swiftconnect import PeerError
+from .transport import TransportOptions
 from .utmremotemessage import UTMRemoteMessageClient as CM
 from .utmremotemessage import UTMRemoteMessageServer as SM
 
@@ -21,8 +36,74 @@ def _fingerprint_pem(pem):
     return _fingerprint_der(ssl.PEM_cert_to_DER_cert(pem))
 
 
+def _new_ssl_context():
+    ssl_context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLS_CLIENT)
+    ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
+
+
+@functools.cache
+def _shared_ssl_context(tls13=False, ciphers=None):
+    ssl_context = _new_ssl_context()
+    TransportOptions(tls13=tls13, ciphers=ciphers).configure_ssl_context(
+        ssl_context)
+    return ssl_context
+
+
+class ClientIdentity:
+
+    _loaded = {}
+
+    def __init__(self, certificate, ssl_context=None, password='password'):
+        owned = ssl_context is None
+        if owned:
+            ssl_context = _new_ssl_context()
+        self.certificate = certificate
+        self.password = password
+        self.fingerprint = None
+        if certificate is not None:
+            ssl_context.load_cert_chain(certificate, password=password)
+            with open(certificate, "r") as certfile:
+                self.fingerprint = _fingerprint_pem(certfile.read())
+        self.ssl_context = ssl_context
+        self.session_cache = SSLSessionCache()
+        if owned:
+            self.session_cache.enable(ssl_context)
+        self._ssl_contexts = {TransportOptions().tls_key: ssl_context}
+
+    def ssl_context_for(self, transport_options=None):
+        if transport_options is None:
+            return self.ssl_context
+        ssl_context = self._ssl_contexts.get(transport_options.tls_key)
+        if ssl_context is None:
+            ssl_context = _new_ssl_context()
+            if self.certificate is not None:
+                ssl_context.load_cert_chain(self.certificate,
+                                            password=self.password)
+            transport_options.configure_ssl_context(ssl_context)
+            self.session_cache.enable(ssl_context)
+            self._ssl_contexts[transport_options.tls_key] = ssl_context
+        return ssl_context
+
+    @classmethod
+    def load(cls, certificate):
+        if certificate is None:
+            key = None
+        else:
+            st = os.stat(certificate)
+            key = (os.path.abspath(certificate), st.st_mtime_ns, st.st_size)
+        identity = cls._loaded.get(key)
+        if identity is None:
+            identity = cls._loaded[key] = cls(certificate)
+        return identity
+
+
 class UTMRemoteClient:
 
+    happy_eyeballs_delay = 0.25
+
     class Local(LocalInterface):
 
         def __init__(self, remoteClient):
@@ -50,38 +131,81 @@ class UTMRemoteClient:
             else:
                 raise ValueError(f"Message ID '{message}' is unsupported.")
 
+        def connectionLost(self, error):
+            peer = self.remoteClient.peer
+            if peer is not None and peer.local is self:
+                self.remoteClient.connection_lost(error)
+
         async def _handshake(self, req):
             return CM.ClientHandshake.Reply(version=1, capabilities=0)
 
         async def _listHasChanged(self, req):
+            self.remoteClient._publish(req)
+            self.remoteClient.inventory.listHasChanged(req.ids)
+            self.remoteClient.configurations.listHasChanged(req.ids)
             await self.remoteClient.remoteListHasChanged(req.ids)
             return CM.ListHasChanged.Reply()
 
         async def _qemuConfigurationHasChanged(self, req):
+            self.remoteClient._publish(req)
+            self.remoteClient.configurations.qemuConfigurationHasChanged(
+                req.id, req.configuration)
             await self.remoteClient.remoteQemuConfigurationHasChanged(
                 req.id, req.configuration)
             return CM.QEMUConfigurationHasChanged.Reply()
 
         async def _mountedDrivesHasChanged(self, req):
+            self.remoteClient._publish(req)
+            self.remoteClient.inventory.mountedDrivesHasChanged(
+                req.id, req.mountedDrives)
             await self.remoteClient.remoteMountedDrivesHasChanged(
                 req.id, req.mountedDrives)
             return CM.MountedDrivesHasChanged.Reply()
 
         async def _virtualMachineDidTransition(self, req):
+            self.remoteClient._publish(req)
+            self.remoteClient.inventory.virtualMachineDidTransition(
+                req.id, req.state, req.isTakeoverAllowed)
+            self.remoteClient._state_reached(req.id, req.state)
             await self.remoteClient.remoteVirtualMachineDidTransition(
                 req.id, req.state, req.isTakeoverAllowed)
             return CM.VirtualMachineDidTransition.Reply()
 
         async def _virtualMachineDidError(self, req):
+            self.remoteClient._publish(req)
             await self.remoteClient.remoteVirtualMachineDidError(
                 req.id, req.errorMessage)
             return CM.VirtualMachineDidError.Reply()
 
     class Remote:
 
-        def __init__(self, peer):
+        def __init__(self, peer, server_information=None):
             self.peer = peer
+            self.server_information = server_information
             self.capabilities = None
+            self.inflight = {}
+            self.calls = 0
+            self.coalesced = 0
+            self.info_batcher = MicroBatcher(
+                self.getVirtualMachineInformation, lambda info: info.id)
+
+        def _flight_done(self, key, future):
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+            if not future.cancelled():
+                future.exception()
+
+        async def _single_flight(self, key, func, parameters):
+            future = self.inflight.get(key)
+            if future is None:
+                self.calls += 1
+                future = asyncio.ensure_future(func(parameters))
+                self.inflight[key] = future
+                future.add_done_callback(
+                    functools.partial(self._flight_done, key))
+            else:
+                self.coalesced += 1
+            return await asyncio.shield(future)
 
         async def handshake(self, password=None):
             reply = await self._handshake(SM.ServerHandshake.Request(
@@ -93,7 +217,8 @@ class UTMRemoteClient:
             return reply.isAuthenticated, reply.model
 
         async def listVirtualMachines(self):
-            return (await self._listVirtualMachines(
+            return (await self._single_flight(
+                (SM.listVirtualMachines,), self._listVirtualMachines,
                 SM.ListVirtualMachines.Request())).ids
 
         async def reorderVirtualMachines(self, ids, toOffset):
@@ -101,15 +226,41 @@ class UTMRemoteClient:
                 SM.ReorderVirtualMachines.Request(ids=ids, toOffset=toOffset))
 
         async def getVirtualMachineInformation(self, ids):
-            return (await self._getVirtualMachineInformation(
+            return (await self._single_flight(
+                (SM.getVirtualMachineInformation, tuple(ids)),
+                self._getVirtualMachineInformation,
                 SM.GetVirtualMachineInformation.Request(ids=ids))).informations
 
+        async def iterVirtualMachineInformation(self, ids=None, page_size=64,
+                                                window=4, ordered=False):
+            if ids is None:
+                ids = await self.listVirtualMachines()
+            pages = [ids[i:i+page_size] for i in range(0, len(ids), page_size)]
+            operation = BulkOperation(
+                lambda index: self.getVirtualMachineInformation(pages[index]),
+                range(len(pages)), concurrency=window)
+            buffered = {}
+            next_index = 0
+            async with contextlib.aclosing(aiter(operation)) as results:
+                async for result in results:
+                    buffered[result.id] = result.get()
+                    while (next_index if ordered else result.id) in buffered:
+                        for info in buffered.pop(
+                                next_index if ordered else result.id):
+                            yield info
+                        next_index += 1
+
+        async def getInfo(self, id):
+            return await self.info_batcher.get(id)
+
         async def getQEMUConfiguration(self, id):
-            return (await self._getQEMUConfiguration(
+            return (await self._single_flight(
+                (SM.getQEMUConfiguration, id), self._getQEMUConfiguration,
                 SM.GetQEMUConfiguration.Request(id=id))).configuration
 
         async def getPackageSize(self, id):
-            return (await self._getPackageSize(
+            return (await self._single_flight(
+                (SM.getPackageSize, id), self._getPackageSize,
                 SM.GetPackageSize.Request(id=id))).size
 
         async def getPackageFile(self, id, relativePathComponents,
@@ -137,9 +288,12 @@ class UTMRemoteClient:
                 SM.MountGuestToolsOnVirtualMachine.Request(id=id))
 
         async def startVirtualMachine(self, id, options=0):
-            return (await self._startVirtualMachine(
+            serverInfo = (await self._startVirtualMachine(
                 SM.StartVirtualMachine.Request(id=id,
                                                options=options))).serverInfo
+            if self.server_information is not None:
+                self.server_information(serverInfo)
+            return serverInfo
 
         async def stopVirtualMachine(self, id, method):
             await self._stopVirtualMachine(
@@ -174,6 +328,11 @@ class UTMRemoteClient:
                 SM.ChangePointerTypeVirtualMachine.Request(
                             id=id, isTabletMode=tablet))
 
+        def bulk(self, op, ids, *args, concurrency=16, timeout=None):
+            if isinstance(op, str):
+                op = getattr(self, op)
+            return BulkOperation(op, ids, args, concurrency, timeout)
+
         async def _handshake(self, parameters):
             return await SM.ServerHandshake.send(parameters, self.peer)
 
@@ -251,19 +410,19 @@ class UTMRemoteClient:
 
     @classmethod
     async def get_spice_cert(cls, server, expected_pubkey=None,
-                             ssl_context=None):
+                             ssl_context=None, transport_options=None):
         loop = asyncio.get_running_loop()
         if isinstance(server, tuple):
             connargs = dict(zip(["host", "port"], server))
         else:
             connargs = {"sock": server}
         if ssl_context is None:
-            ssl_context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLS_CLIENT)
-            ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
+            ssl_context = _shared_ssl_context(
+                *(transport_options or TransportOptions()).tls_key)
         reader, _ = await asyncio.open_connection(
             ssl=ssl_context, **connargs)
+        if transport_options is not None:
+            transport_options.configure_transport(reader._transport)
         sslobj = reader._transport.get_extra_info('ssl_object')
         peercert = sslobj.getpeercert(True)
         if expected_pubkey:
@@ -271,33 +430,99 @@ class UTMRemoteClient:
         reader._transport.close()
         return ssl.DER_cert_to_PEM_cert(peercert)
 
-    def __init__(self, certificate, ssl_context=None, debug=False):
+    def __init__(self, certificate, ssl_context=None, debug=False,
+                 session_cache=None, max_frame_size=None,
+                 max_memory_frame_size=None, spill_directory=None,
+                 transport_options=None, heartbeat_interval=None,
+                 heartbeat_timeout=5.0, heartbeat_probe=None,
+                 configuration_cache_size=128,
+                 prefetch_spice_certificates=True,
+                 offload_threshold=1 << 20, offload_executor=None):
         self.debug = debug
         self.transport = None
-        if ssl_context is None:
-            ssl_context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLS_CLIENT)
-            ssl_context.minimum_version = ssl.TLSVersion.TLSv1_2
-            ssl_context.check_hostname = False
-            ssl_context.verify_mode = ssl.CERT_NONE
-        if certificate is not None:
-            ssl_context.load_cert_chain(certificate, password='password')
-            with open(certificate, "r") as certfile:
-                self.client_fingerprint = _fingerprint_pem(certfile.read())
+        self.peer = None
+        self.server_host = None
+        self.prefetch_spice_certificates = prefetch_spice_certificates
+        self.offload_threshold = offload_threshold
+        self.offload_executor = offload_executor
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.heartbeat_probe = heartbeat_probe
+        self._heartbeat_task = None
+        self.event_streams = set()
+        self._state_waiters = collections.defaultdict(list)
+        self.inventory = VirtualMachineInventory(self)
+        self.configurations = QEMUConfigurationCache(
+            self, configuration_cache_size)
+        self.transport_options = transport_options
+        self.spice_certificates = SpiceCertificateCache(
+            functools.partial(self.get_spice_cert,
+                              transport_options=transport_options))
+        self.max_frame_size = max_frame_size
+        self.max_memory_frame_size = max_memory_frame_size
+        self.spill_directory = spill_directory
+        if isinstance(certificate, ClientIdentity):
+            identity = certificate
+            ssl_context = identity.ssl_context_for(transport_options)
+        elif ssl_context is None:
+            identity = ClientIdentity.load(certificate)
+            ssl_context = identity.ssl_context_for(transport_options)
+        else:
+            if transport_options is not None and \
+               transport_options.tls_key != TransportOptions().tls_key:
+                raise ValueError("Set TLS options on ssl_context directly")
+            identity = ClientIdentity(certificate, ssl_context)
+        if identity.fingerprint is not None:
+            self.client_fingerprint = identity.fingerprint
+        if session_cache is None:
+            session_cache = identity.session_cache
+        self.identity = identity
         self.ssl_context = ssl_context
+        self.session_cache = session_cache
 
     async def _connect(self, server, password=None, expected_fingerprint=None,
                        password_query=None):
         loop = asyncio.get_running_loop()
+
+        def protocol_factory():
+            peer = Peer(self.Local(self))
+            peer.offload_threshold = self.offload_threshold
+            peer.executor = self.offload_executor
+            return SwiftConnectProtocol(
+                peer, self.max_frame_size,
+                self.max_memory_frame_size, self.spill_directory)
+
         if isinstance(server, tuple):
-            connargs = dict(zip(["host", "port"], server))
+            host, port = server
+            if not isinstance(host, str):
+                host = tuple(host)
+            session_key = (host, port)
         else:
-            connargs = {"sock": server}
-        self.peer = Peer(self.Local(self))
-        self.transport, protocol = await loop.create_connection(
-            lambda: SwiftConnectProtocol(self.peer),
-            ssl=self.ssl_context, **connargs)
+            session_key = server.getpeername()[:2]
+        with self.session_cache.resuming(
+                session_key, self.ssl_context) as cached_peercert:
+            if isinstance(server, tuple):
+                self.transport, self.protocol = await happyeyeballs.connect(
+                    protocol_factory, host, port, self.ssl_context,
+                    self.happy_eyeballs_delay, self.transport_options)
+            else:
+                self.transport, self.protocol = await loop.create_connection(
+                    protocol_factory, ssl=self.ssl_context, sock=server)
+        self.peer = self.protocol.peer
+        if isinstance(server, tuple) and isinstance(host, str):
+            self.server_host = host
+        else:
+            self.server_host = self.transport.get_extra_info('peername')[0]
+        if self.transport_options is not None:
+            self.transport_options.configure_transport(self.transport)
         ssl = self.transport.get_extra_info('ssl_object')
-        self.server_fingerprint = _fingerprint_der(ssl.getpeercert(True))
+        peercert = ssl.getpeercert(True)
+        if self.session_cache.record(ssl):
+            if self.debug:
+                print("TLS session resumed")
+            if peercert is None:
+                peercert = cached_peercert
+        self.server_fingerprint = _fingerprint_der(peercert)
         if self.debug:
             fp = self.server_fingerprint.hex(':', 1).upper()
             print(f"server fingerprint: {fp}")
@@ -325,7 +550,7 @@ class UTMRemoteClient:
             if expected_fingerprint != self.connection_fingerprint:
                 raise ConnectionError("Fingerprint mismatch")
         await self.peer.trusted()
-        self.remote = self.Remote(self.peer)
+        self.remote = self.Remote(self.peer, self._server_information)
         isAuthenticated, device = await self.remote.handshake(password)
         if not isAuthenticated and password_query is not None:
             password = password_query()
@@ -337,6 +562,36 @@ class UTMRemoteClient:
             raise ValueError("Password invalid" if password else
                              "Password required")
         self.remote.model = str(device)
+        self.session_cache.put(session_key, self.ssl_context, ssl, peercert)
+        if self.heartbeat_interval:
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        protocol = self.protocol
+        while not self.transport.is_closing():
+            idle = loop.time() - protocol.last_progress
+            if idle < self.heartbeat_interval:
+                await asyncio.sleep(self.heartbeat_interval - idle)
+                continue
+            probe = self.heartbeat_probe or (
+                lambda remote: remote.listVirtualMachines())
+            try:
+                await asyncio.wait_for(probe(self.remote),
+                                       self.heartbeat_timeout)
+            except PeerError:
+                pass
+            except asyncio.TimeoutError:
+                if loop.time() - protocol.last_progress < \
+                   self.heartbeat_timeout:
+                    continue
+                if self.debug:
+                    print("heartbeat timed out")
+                self.peer.failAll(ConnectionError("Heartbeat timed out"))
+                self.transport.abort()
+                return
+            except Exception:
+                return
 
     async def connect(self, server, password=None, expected_fingerprint=None,
                       password_query=None):
@@ -344,13 +599,84 @@ class UTMRemoteClient:
             await self._connect(
                 server, password, expected_fingerprint, password_query)
         except:  # noqa: E722
+            if isinstance(server, tuple):
+                happyeyeballs.forget(*server)
             self._cleanup()
             raise
+        if isinstance(server, tuple):
+            happyeyeballs.remember(self.transport, *server)
+
+    def spice_server(self, serverInfo):
+        if serverInfo.spicePortExternal:
+            return (serverInfo.spiceHostExternal,
+                    serverInfo.spicePortExternal)
+        if serverInfo.spicePortInternal:
+            return (self.server_host, serverInfo.spicePortInternal)
+        return None
+
+    def _server_information(self, serverInfo):
+        server = self.spice_server(serverInfo)
+        if self.prefetch_spice_certificates and server is not None:
+            self.spice_certificates.prefetch(
+                server, serverInfo.spicePublicKey)
+
+    def _state_reached(self, id, state):
+        for states, future in self._state_waiters.get(id, ()):
+            if state in states and not future.done():
+                future.set_result(state)
+
+    def _fail_state_waiters(self, error):
+        for waiters in self._state_waiters.values():
+            for _, future in waiters:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def wait_for_state(self, id, states, timeout=None):
+        if isinstance(states, int):
+            states = (states,)
+        states = frozenset(states)
+        future = asyncio.get_running_loop().create_future()
+        waiter = (states, future)
+        self._state_waiters[id].append(waiter)
+        try:
+            async with asyncio.timeout(timeout):
+                info = await self.remote.getInfo(id)
+                if info.state in states and not future.done():
+                    future.set_result(info.state)
+                return await future
+        finally:
+            waiters = self._state_waiters[id]
+            waiters.remove(waiter)
+            if not waiters:
+                del self._state_waiters[id]
+
+    def wait_for_states(self, ids, states, timeout=None):
+        ids = list(ids)
+        return BulkOperation(self.wait_for_state, ids, (states, timeout),
+                             concurrency=max(1, len(ids)))
+
+    def events(self, max_size=256, overflow="coalesce"):
+        stream = EventStream(max_size, overflow, self.event_streams.discard)
+        self.event_streams.add(stream)
+        return stream
+
+    def _publish(self, event):
+        received = time.time()
+        for stream in list(self.event_streams):
+            event = copy.copy(event)
+            event.received = received
+            stream.put(event)
 
     def close(self):
+        self._fail_state_waiters(ConnectionError("Client closed"))
+        for stream in list(self.event_streams):
+            stream.close()
         self._cleanup()
 
     def _cleanup(self):
+        if getattr(self, '_heartbeat_task', None) is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
         if self.transport is not None:
             self.transport.close()
             self.transport = None
@@ -359,11 +685,20 @@ class UTMRemoteClient:
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self._cleanup()
+        self.close()
 
     def __del__(self):
         self._cleanup()
 
+    def connection_lost(self, error):
+        if self.debug:
+            print(f"connection_lost({error!r})")
+        self._fail_state_waiters(error or ConnectionError("Connection lost"))
+        if self._heartbeat_task is not None and \
+           self._heartbeat_task is not asyncio.current_task():
+            self._heartbeat_task.cancel()
+        self._heartbeat_task = None
+
     async def remoteListHasChanged(self, ids):
         if self.debug:
             print(f"remoteListHasChanged(ids)")
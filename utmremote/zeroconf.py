@@ -77,6 +77,10 @@ class ServiceBrowser(GObject.GObject, _ServiceBrowser):
     def get_services(self):
         return sorted(list(self.services))
 
+    def get_addresses(self, name, port):
+        return sorted(address for n, address, p in self.services
+                      if n == name and p == port)
+
     def do_new_service(self, name, address, port):
         pass
 